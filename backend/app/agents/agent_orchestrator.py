@@ -3,16 +3,24 @@ Agent编排器
 基于LangGraph实现的多Agent协调和工作流编排
 """
 
-from typing import Any, Dict, List, Optional, Callable, Type
+from typing import Any, Dict, List, Mapping, Optional, Callable, Set, Tuple, Type, TypedDict
 import asyncio
+import hashlib
+from collections import ChainMap, Counter
+import time
+import uuid
 from datetime import datetime
 from enum import Enum
 
+import orjson
+from cachetools import TTLCache
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.graph import StateGraph, END
 from langgraph.graph.state import CompiledStateGraph
 from pydantic import BaseModel, Field
 
 from app.agents.base_agent import BaseAgent, AgentTask, AgentStatus, AgentCapability
+from app.core.config import settings
 from app.utils.logger import logger, LoggerMixin
 
 
@@ -28,48 +36,103 @@ class WorkflowStatus(str, Enum):
 
 class WorkflowStep(BaseModel):
     """工作流步骤模型"""
-    id: str = Field(description="步骤ID")
-    name: str = Field(description="步骤名称")
-    agent_type: str = Field(description="Agent类型")
-    input_mapping: Dict[str, str] = Field(default_factory=dict, description="输入映射")
-    output_mapping: Dict[str, str] = Field(default_factory=dict, description="输出映射")
-    conditions: Dict[str, Any] = Field(default_factory=dict, description="执行条件")
-    retry_count: int = Field(default=0, description="重试次数")
-    max_retries: int = Field(default=3, description="最大重试次数")
-    timeout_seconds: int = Field(default=300, description="超时时间")
+    id: str  # 步骤ID
+    name: str  # 步骤名称
+    agent_type: str  # Agent类型
+    input_mapping: Dict[str, str] = Field(default_factory=dict)  # 输入映射
+    output_mapping: Dict[str, str] = Field(default_factory=dict)  # 输出映射
+    conditions: Dict[str, Any] = Field(default_factory=dict)  # 执行条件
+    max_retries: int = 3  # 最大重试次数
+    timeout_seconds: int = 300  # 超时时间
+    cacheable: bool = False  # 相同输入可复用结果(幂等步骤)
+    keep_result: bool = False  # 在工作流状态中保留完整步骤结果
 
 
-class WorkflowState(BaseModel):
-    """工作流状态模型"""
-    workflow_id: str = Field(description="工作流ID")
-    name: str = Field(description="工作流名称")
-    status: WorkflowStatus = Field(default=WorkflowStatus.PENDING, description="状态")
-    current_step: Optional[str] = Field(default=None, description="当前步骤")
-    completed_steps: List[str] = Field(default_factory=list, description="已完成步骤")
-    failed_steps: List[str] = Field(default_factory=list, description="失败步骤")
-    context: Dict[str, Any] = Field(default_factory=dict, description="上下文数据")
-    results: Dict[str, Any] = Field(default_factory=dict, description="步骤结果")
-    created_at: datetime = Field(default_factory=datetime.now, description="创建时间")
-    started_at: Optional[datetime] = Field(default=None, description="开始时间")
-    completed_at: Optional[datetime] = Field(default=None, description="完成时间")
-    error: Optional[str] = Field(default=None, description="错误信息")
+class WorkflowState(TypedDict, total=False):
+    """工作流状态 - LangGraph状态图直接使用TypedDict，节点更新无需模型校验"""
+    workflow_id: str  # 工作流ID
+    name: str  # 工作流名称
+    status: WorkflowStatus  # 状态
+    current_step: Optional[str]  # 当前步骤
+    completed_steps: List[str]  # 已完成步骤
+    failed_steps: List[str]  # 失败步骤
+    context: ChainMap  # 上下文数据(步骤输出写入顶层，输入数据作为只读底层共享)
+    results: Dict[str, Any]  # 步骤结果
+    retry_counts: Dict[str, int]  # 步骤重试次数
+    created_at: datetime  # 创建时间
+    started_at: Optional[datetime]  # 开始时间
+    completed_at: Optional[datetime]  # 完成时间
+    error: Optional[str]  # 错误信息
+
+
+def new_workflow_state(workflow_id: str, name: str) -> WorkflowState:
+    """创建带默认值的工作流状态"""
+    return WorkflowState(
+        workflow_id=workflow_id,
+        name=name,
+        status=WorkflowStatus.PENDING,
+        current_step=None,
+        completed_steps=[],
+        failed_steps=[],
+        context=ChainMap(),
+        results={},
+        retry_counts={},
+        created_at=datetime.now(),
+        started_at=None,
+        completed_at=None,
+        error=None
+    )
+
+
+# Agent工厂: (agent_id, name, capabilities, config) -> Agent实例
+AgentFactory = Callable[[str, str, List[AgentCapability], Optional[Dict[str, Any]]], BaseAgent]
 
 
 class AgentOrchestrator(LoggerMixin):
     """Agent编排器"""
     
-    def __init__(self):
+    # 步骤重试会在图中形成回边，放宽LangGraph默认的递归上限
+    RECURSION_LIMIT = 100
+    
+    def __init__(
+        self,
+        checkpointer: Optional[BaseCheckpointSaver] = None,
+        max_concurrent_tasks: int = 16,
+        max_concurrent_workflows: int = 64
+    ):
+        # 可选的LangGraph检查点存储(如SqliteSaver)，用于按步骤持久化状态并在重试/恢复时跳过已完成步骤
+        self.checkpointer = checkpointer
+        # 限制所有工作流中同时执行的步骤任务数，避免突发负载压垮事件循环和下游限流
+        self._task_sem = asyncio.Semaphore(max_concurrent_tasks)
+        # 限制同时运行的工作流数，超出的执行排队等待，避免积压的图状态和等待步骤信号量的协程无限增长
+        self._workflow_sem = asyncio.Semaphore(max_concurrent_workflows)
+        # 可缓存步骤的结果缓存: 结果键 -> 步骤结果
+        self._step_cache: TTLCache = TTLCache(maxsize=settings.CACHE_MAX_SIZE, ttl=settings.CACHE_TTL)
         self.agents: Dict[str, BaseAgent] = {}
         self.agent_types: Dict[str, Type[BaseAgent]] = {}
+        # Agent类型 -> 预绑定类的工厂函数
+        self._factories: Dict[str, AgentFactory] = {}
         self.workflows: Dict[str, CompiledStateGraph] = {}
+        # 工作流定义(步骤, 连接)，绑定的Agent被移除后据此重新编译
+        self._workflow_defs: Dict[str, Tuple[List[WorkflowStep], Dict[str, List[str]]]] = {}
         self.workflow_states: Dict[str, WorkflowState] = {}
-        self.running_workflows: Dict[str, asyncio.Task] = {}
+        self.running_workflows: Dict[str, Set[asyncio.Task]] = {}
+        # 按工作流结构缓存已编译的图，结构相同的工作流共享同一个图(及其绑定的Agent)
+        self._compiled_by_shape: Dict[Tuple, CompiledStateGraph] = {}
         
         self.logger.info("Agent编排器已初始化")
     
     def register_agent_type(self, agent_type: str, agent_class: Type[BaseAgent]) -> None:
         """注册Agent类型"""
         self.agent_types[agent_type] = agent_class
+        self._factories[agent_type] = (
+            lambda agent_id, name, capabilities, config, cls=agent_class: cls(
+                agent_id=agent_id,
+                name=name,
+                capabilities=capabilities,
+                config=config
+            )
+        )
         self.logger.info(f"Agent类型已注册: {agent_type}")
     
     async def create_agent(
@@ -81,19 +144,14 @@ class AgentOrchestrator(LoggerMixin):
         config: Optional[Dict[str, Any]] = None
     ) -> BaseAgent:
         """创建Agent实例"""
-        if agent_type not in self.agent_types:
+        factory = self._factories.get(agent_type)
+        if factory is None:
             raise ValueError(f"未知的Agent类型: {agent_type}")
         
         if agent_id in self.agents:
             raise ValueError(f"Agent ID已存在: {agent_id}")
         
-        agent_class = self.agent_types[agent_type]
-        agent = agent_class(
-            agent_id=agent_id,
-            name=name,
-            capabilities=capabilities,
-            config=config
-        )
+        agent = factory(agent_id, name, capabilities, config)
         
         self.agents[agent_id] = agent
         await agent.start()
@@ -121,9 +179,15 @@ class AgentOrchestrator(LoggerMixin):
         await agent.stop()
         del self.agents[agent_id]
         
+        # 编译后的图在步骤中绑定了Agent实例，移除后作废相关的图，下次执行时重新编译
+        for workflow_id, (steps, connections) in self._workflow_defs.items():
+            if any(self._step_agent_id(step) == agent_id for step in steps):
+                self._compiled_by_shape.pop(self._workflow_shape_key(steps, connections), None)
+                self.workflows.pop(workflow_id, None)
+        
         self.logger.info(f"Agent已移除: {agent_id}")
     
-    def create_workflow(
+    async def create_workflow(
         self,
         workflow_id: str,
         name: str,
@@ -131,156 +195,236 @@ class AgentOrchestrator(LoggerMixin):
         connections: Dict[str, List[str]]
     ) -> None:
         """创建工作流"""
-        if workflow_id in self.workflows:
+        if workflow_id in self._workflow_defs:
             raise ValueError(f"工作流ID已存在: {workflow_id}")
         
-        # 创建LangGraph状态图
+        self.workflows[workflow_id] = await self._get_or_compile(steps, connections)
+        self._workflow_defs[workflow_id] = (steps, connections)
+        
+        # 初始化工作流状态
+        self.workflow_states[workflow_id] = new_workflow_state(workflow_id, name)
+        
+        self.logger.info(
+            f"工作流已创建",
+            workflow_id=workflow_id,
+            name=name,
+            steps_count=len(steps)
+        )
+    
+    @staticmethod
+    def _workflow_shape_key(
+        steps: List[WorkflowStep],
+        connections: Dict[str, List[str]]
+    ) -> Tuple:
+        """计算工作流结构键(步骤定义 + 连接关系)"""
+        return (
+            tuple(step.model_dump_json() for step in steps),
+            tuple(sorted((from_step, tuple(to_steps)) for from_step, to_steps in connections.items()))
+        )
+    
+    async def _get_or_compile(
+        self,
+        steps: List[WorkflowStep],
+        connections: Dict[str, List[str]]
+    ) -> CompiledStateGraph:
+        """按结构复用已编译的图，未命中时创建步骤Agent并编译"""
+        shape_key = self._workflow_shape_key(steps, connections)
+        compiled_graph = self._compiled_by_shape.get(shape_key)
+        
+        if compiled_graph is None:
+            agents = {
+                step.id: await self._get_or_create_agent(step.agent_type, step.id)
+                for step in steps
+            }
+            compiled_graph = self._compile_workflow(steps, connections, agents)
+            self._compiled_by_shape[shape_key] = compiled_graph
+        
+        return compiled_graph
+    
+    def _compile_workflow(
+        self,
+        steps: List[WorkflowStep],
+        connections: Dict[str, List[str]],
+        agents: Dict[str, BaseAgent]
+    ) -> CompiledStateGraph:
+        """构建并编译LangGraph状态图"""
         graph = StateGraph(WorkflowState)
         
         # 添加节点(步骤)
         for step in steps:
-            graph.add_node(step.id, self._create_step_function(step))
+            graph.add_node(step.id, self._create_step_function(step, agents[step.id]))
         
-        # 添加边(连接)
-        for from_step, to_steps in connections.items():
-            if not to_steps:  # 结束节点
-                graph.add_edge(from_step, END)
-            else:
-                for to_step in to_steps:
-                    graph.add_edge(from_step, to_step)
+        # 添加边(连接)：步骤待重试时路由回自身，否则进入后续步骤
+        # 条件边只能路由到单个节点，状态未声明归并规则时也不支持并行分支
+        for step in steps:
+            next_steps = connections.get(step.id, [])
+            if len(next_steps) > 1:
+                raise ValueError(f"步骤存在多个后续步骤，暂不支持并行分支: {step.id}")
+            next_node = next_steps[0] if next_steps else END
+            graph.add_conditional_edges(step.id, self._create_step_router(step, next_node))
         
         # 设置入口点
         if steps:
             graph.set_entry_point(steps[0].id)
         
-        # 编译图
-        compiled_graph = graph.compile()
-        self.workflows[workflow_id] = compiled_graph
-        
-        # 初始化工作流状态
-        self.workflow_states[workflow_id] = WorkflowState(
-            workflow_id=workflow_id,
-            name=name
-        )
-        
-        self.logger.info(
-            f"工作流已创建",
-            workflow_id=workflow_id,
-            name=name,
-            steps_count=len(steps)
-        )
+        return graph.compile(checkpointer=self.checkpointer)
+    
+    @staticmethod
+    def _create_step_router(step: WorkflowStep, next_node: str) -> Callable:
+        """创建步骤路由函数"""
+        def route(state: WorkflowState) -> str:
+            if state["status"] == WorkflowStatus.FAILED:
+                return END
+            if step.id not in state["completed_steps"]:
+                return step.id  # 等待重试
+            return next_node
+        
+        return route
     
-    def _create_step_function(self, step: WorkflowStep) -> Callable:
+    def _create_step_function(self, step: WorkflowStep, agent: BaseAgent) -> Callable:
         """创建步骤执行函数"""
+        # 步骤的条件与映射在图的生命周期内不变，预先展开为元组供闭包复用
+        cond_items = tuple(step.conditions.items())
+        in_items = tuple(step.input_mapping.items())
+        out_items = tuple(step.output_mapping.items())
+        # 每个步骤只绑定一次logger，低于日志级别的调用由structlog直接丢弃
+        step_logger = self.logger.bind(step_id=step.id, step_name=step.name)
+        
         async def step_function(state: WorkflowState) -> WorkflowState:
             """执行工作流步骤"""
+            # 从检查点恢复或重试时跳过已完成的步骤
+            if step.id in state["completed_steps"]:
+                return state
+            
             try:
-                self.logger.info(
-                    f"开始执行步骤",
-                    workflow_id=state.workflow_id,
-                    step_id=step.id,
-                    step_name=step.name
-                )
+                step_logger.info("开始执行步骤", workflow_id=state["workflow_id"])
                 
-                state.current_step = step.id
+                state["current_step"] = step.id
                 
                 # 检查执行条件
-                if not self._check_conditions(step.conditions, state.context):
-                    self.logger.info(
-                        f"步骤条件不满足，跳过执行",
-                        workflow_id=state.workflow_id,
-                        step_id=step.id
-                    )
-                    state.completed_steps.append(step.id)
+                if cond_items and not self._check_conditions(cond_items, state["context"]):
+                    step_logger.info("步骤条件不满足，跳过执行", workflow_id=state["workflow_id"])
+                    state["completed_steps"].append(step.id)
                     return state
                 
                 # 准备输入数据
-                input_data = self._prepare_input(step.input_mapping, state.context)
+                input_data = self._prepare_input(in_items, state["context"])
                 
-                # 查找或创建Agent
-                agent = await self._get_or_create_agent(step.agent_type, step.id)
+                start_ns = time.monotonic_ns()
                 
-                # 创建任务
-                task = AgentTask(
-                    id=f"{state.workflow_id}_{step.id}",
-                    type=step.name,
-                    payload=input_data
-                )
+                # 幂等步骤优先复用相同输入的历史结果
+                cache_key = self._step_cache_key(step, input_data) if step.cacheable else None
+                result = self._step_cache.get(cache_key) if cache_key else None
                 
-                # 执行任务
-                result = await agent.process_task(task)
+                if result is None:
+                    # 创建任务
+                    task = AgentTask(
+                        id=f"{state['workflow_id']}_{step.id}",
+                        type=step.name,
+                        payload=input_data
+                    )
+                    
+                    # 执行任务
+                    async with self._task_sem:
+                        result = await agent.process_task(task)
+                    
+                    if cache_key:
+                        self._step_cache[cache_key] = result
                 
                 # 处理输出
-                output_data = self._process_output(step.output_mapping, result)
-                state.context.update(output_data)
-                state.results[step.id] = result
-                state.completed_steps.append(step.id)
+                output_data = self._process_output(out_items, result)
+                state["context"].update(output_data)
+                if step.keep_result:
+                    state["results"][step.id] = result
+                else:
+                    # 所需字段已映射进上下文，仅保留结果摘要供调试回放比对
+                    state["results"][step.id] = self._result_digest(result)
+                state["completed_steps"].append(step.id)
                 
-                self.logger.info(
-                    f"步骤执行完成",
-                    workflow_id=state.workflow_id,
-                    step_id=step.id,
-                    execution_time=result.get("execution_time", 0)
+                step_logger.info(
+                    "步骤执行完成",
+                    workflow_id=state["workflow_id"],
+                    execution_time=(time.monotonic_ns() - start_ns) / 1e9
                 )
                 
             except Exception as e:
-                self.logger.error(
-                    f"步骤执行失败",
-                    workflow_id=state.workflow_id,
-                    step_id=step.id,
+                step_logger.error(
+                    "步骤执行失败",
+                    workflow_id=state["workflow_id"],
                     error=str(e),
                     exc_info=True
                 )
                 
-                step.retry_count += 1
+                retry_count = state["retry_counts"].get(step.id, 0) + 1
+                state["retry_counts"][step.id] = retry_count
                 
-                if step.retry_count <= step.max_retries:
-                    self.logger.info(
-                        f"重试步骤执行",
-                        workflow_id=state.workflow_id,
-                        step_id=step.id,
-                        retry_count=step.retry_count
+                if retry_count <= step.max_retries:
+                    step_logger.info(
+                        "重试步骤执行",
+                        workflow_id=state["workflow_id"],
+                        retry_count=retry_count
                     )
-                    return await step_function(state)
+                    # 指数退避，由条件边将状态路由回本步骤
+                    await asyncio.sleep(min(2 ** (retry_count - 1), 30))
                 else:
-                    state.failed_steps.append(step.id)
-                    state.status = WorkflowStatus.FAILED
-                    state.error = str(e)
+                    state["failed_steps"].append(step.id)
+                    state["status"] = WorkflowStatus.FAILED
+                    state["error"] = str(e)
             
             return state
         
         return step_function
     
-    def _check_conditions(self, conditions: Dict[str, Any], context: Dict[str, Any]) -> bool:
+    @staticmethod
+    def _step_cache_key(step: WorkflowStep, input_data: Dict[str, Any]) -> str:
+        """计算步骤结果缓存键"""
+        payload = orjson.dumps(
+            [step.agent_type, step.name, input_data],
+            default=str,
+            option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+        )
+        return hashlib.blake2b(payload).hexdigest()
+    
+    @staticmethod
+    def _result_digest(result: Dict[str, Any]) -> Dict[str, Any]:
+        """计算步骤结果摘要"""
+        encoded = orjson.dumps(
+            result,
+            default=str,
+            option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+        )
+        return {
+            "hash": hashlib.blake2b(encoded).hexdigest(),
+            "bytes": len(encoded)
+        }
+    
+    @staticmethod
+    def _check_conditions(cond_items: Tuple[Tuple[str, Any], ...], context: Mapping[str, Any]) -> bool:
         """检查执行条件"""
-        if not conditions:
-            return True
-        
-        for key, expected_value in conditions.items():
-            if key not in context or context[key] != expected_value:
-                return False
-        
-        return True
+        return all(key in context and context[key] == expected for key, expected in cond_items)
     
-    def _prepare_input(self, input_mapping: Dict[str, str], context: Dict[str, Any]) -> Dict[str, Any]:
+    @staticmethod
+    def _prepare_input(in_items: Tuple[Tuple[str, str], ...], context: Mapping[str, Any]) -> Dict[str, Any]:
         """准备输入数据"""
-        input_data = {}
-        
-        for output_key, context_key in input_mapping.items():
-            if context_key in context:
-                input_data[output_key] = context[context_key]
-        
-        return input_data
+        return {
+            output_key: context[context_key]
+            for output_key, context_key in in_items
+            if context_key in context
+        }
     
-    def _process_output(self, output_mapping: Dict[str, str], result: Dict[str, Any]) -> Dict[str, Any]:
+    @staticmethod
+    def _process_output(out_items: Tuple[Tuple[str, str], ...], result: Dict[str, Any]) -> Dict[str, Any]:
         """处理输出数据"""
-        output_data = {}
-        
-        for result_key, context_key in output_mapping.items():
-            if result_key in result:
-                output_data[context_key] = result[result_key]
-        
-        return output_data
+        return {
+            context_key: result[result_key]
+            for result_key, context_key in out_items
+            if result_key in result
+        }
+    
+    @staticmethod
+    def _step_agent_id(step: WorkflowStep) -> str:
+        """步骤使用的Agent ID"""
+        return f"{step.agent_type}_{step.id}"
     
     async def _get_or_create_agent(self, agent_type: str, step_id: str) -> BaseAgent:
         """获取或创建Agent"""
@@ -304,51 +448,64 @@ class AgentOrchestrator(LoggerMixin):
         input_data: Dict[str, Any]
     ) -> WorkflowState:
         """执行工作流"""
-        if workflow_id not in self.workflows:
+        if workflow_id not in self._workflow_defs:
             raise ValueError(f"工作流不存在: {workflow_id}")
         
-        if workflow_id in self.running_workflows:
-            raise ValueError(f"工作流正在运行: {workflow_id}")
-        
-        workflow = self.workflows[workflow_id]
-        state = self.workflow_states[workflow_id]
-        
-        # 重置状态
-        state.status = WorkflowStatus.RUNNING
-        state.started_at = datetime.now()
-        state.context = input_data.copy()
-        state.results = {}
-        state.completed_steps = []
-        state.failed_steps = []
-        state.error = None
+        workflow = self.workflows.get(workflow_id)
+        if workflow is None:
+            # 绑定的Agent已被移除，重新创建Agent并编译
+            workflow = await self._get_or_compile(*self._workflow_defs[workflow_id])
+            self.workflows[workflow_id] = workflow
+        
+        # 每次执行使用独立的状态，同一工作流可并发运行
+        state = new_workflow_state(workflow_id, self.workflow_states[workflow_id]["name"])
+        state.update(
+            status=WorkflowStatus.RUNNING,
+            started_at=datetime.now(),
+            context=ChainMap({}, input_data)
+        )
+        self.workflow_states[workflow_id] = state
+        runs = self.running_workflows.setdefault(workflow_id, set())
         
         self.logger.info(
             f"开始执行工作流",
             workflow_id=workflow_id,
-            name=state.name
+            name=state["name"]
         )
         
         try:
             # 创建执行任务
-            task = asyncio.create_task(self._run_workflow(workflow, state))
-            self.running_workflows[workflow_id] = task
+            task = asyncio.create_task(
+                self._run_workflow(workflow, state, f"{workflow_id}_{uuid.uuid4().hex}")
+            )
+            runs.add(task)
             
             # 等待完成
             final_state = await task
             
-            final_state.status = WorkflowStatus.COMPLETED
-            final_state.completed_at = datetime.now()
+            state.update(final_state)
+            state["completed_at"] = datetime.now()
             
-            self.logger.info(
-                f"工作流执行完成",
-                workflow_id=workflow_id,
-                execution_time=(final_state.completed_at - final_state.started_at).total_seconds()
-            )
+            # 步骤重试耗尽时状态已置为FAILED，不能覆盖
+            if state["status"] == WorkflowStatus.FAILED:
+                self.logger.error(
+                    f"工作流执行失败",
+                    workflow_id=workflow_id,
+                    failed_steps=state["failed_steps"],
+                    error=state["error"]
+                )
+            else:
+                state["status"] = WorkflowStatus.COMPLETED
+                self.logger.info(
+                    f"工作流执行完成",
+                    workflow_id=workflow_id,
+                    execution_time=(state["completed_at"] - state["started_at"]).total_seconds()
+                )
             
         except Exception as e:
-            state.status = WorkflowStatus.FAILED
-            state.error = str(e)
-            state.completed_at = datetime.now()
+            state["status"] = WorkflowStatus.FAILED
+            state["error"] = str(e)
+            state["completed_at"] = datetime.now()
             
             self.logger.error(
                 f"工作流执行失败",
@@ -358,19 +515,28 @@ class AgentOrchestrator(LoggerMixin):
             )
             
         finally:
-            if workflow_id in self.running_workflows:
-                del self.running_workflows[workflow_id]
+            runs.discard(task)
+            if not runs:
+                self.running_workflows.pop(workflow_id, None)
         
         return state
     
     async def _run_workflow(
         self,
         workflow: CompiledStateGraph,
-        state: WorkflowState
+        state: WorkflowState,
+        thread_id: str
     ) -> WorkflowState:
         """运行工作流"""
-        # 使用LangGraph执行工作流
-        result = await workflow.ainvoke(state)
+        # 使用LangGraph执行工作流，thread_id用于检查点定位
+        async with self._workflow_sem:
+            result = await workflow.ainvoke(
+                state,
+                config={
+                    "configurable": {"thread_id": thread_id},
+                    "recursion_limit": self.RECURSION_LIMIT
+                }
+            )
         return result
     
     async def get_workflow_status(self, workflow_id: str) -> Optional[WorkflowState]:
@@ -383,57 +549,62 @@ class AgentOrchestrator(LoggerMixin):
             self.logger.warning(f"工作流未在运行: {workflow_id}")
             return
         
-        task = self.running_workflows[workflow_id]
-        task.cancel()
+        for task in self.running_workflows[workflow_id]:
+            task.cancel()
         
         state = self.workflow_states[workflow_id]
-        state.status = WorkflowStatus.CANCELLED
-        state.completed_at = datetime.now()
+        state["status"] = WorkflowStatus.CANCELLED
+        state["completed_at"] = datetime.now()
         
         self.logger.info(f"工作流已取消: {workflow_id}")
     
-    async def get_agent_status_summary(self) -> Dict[str, Any]:
+    async def get_agent_status_summary(self) -> bytes:
+        """获取所有Agent状态摘要(JSON字节)"""
+        return orjson.dumps(await self.get_agent_status_summary_dict())
+    
+    async def get_agent_status_summary_dict(self) -> Dict[str, Any]:
         """获取所有Agent状态摘要"""
+        # 各Agent状态相互独立，并发获取
+        agent_details = list(await asyncio.gather(
+            *(agent.get_status() for agent in self.agents.values())
+        ))
+        
+        # 单次遍历统计各状态数量
+        status_counts = Counter(status["status"] for status in agent_details)
+        
         summary = {
             "total_agents": len(self.agents),
-            "running_agents": 0,
-            "idle_agents": 0,
-            "failed_agents": 0,
-            "agent_details": []
+            "running_agents": status_counts[AgentStatus.RUNNING.value],
+            "idle_agents": status_counts[AgentStatus.IDLE.value],
+            "failed_agents": status_counts[AgentStatus.FAILED.value],
+            "agent_details": agent_details
         }
         
-        for agent in self.agents.values():
-            status = await agent.get_status()
-            summary["agent_details"].append(status)
-            
-            if status["status"] == "running":
-                summary["running_agents"] += 1
-            elif status["status"] == "idle":
-                summary["idle_agents"] += 1
-            elif status["status"] == "failed":
-                summary["failed_agents"] += 1
-        
         return summary
     
-    async def get_workflow_summary(self) -> Dict[str, Any]:
+    async def get_workflow_summary(self) -> bytes:
+        """获取工作流状态摘要(JSON字节)，datetime和枚举由orjson直接序列化"""
+        return orjson.dumps(await self.get_workflow_summary_dict())
+    
+    async def get_workflow_summary_dict(self) -> Dict[str, Any]:
         """获取工作流状态摘要"""
         summary = {
-            "total_workflows": len(self.workflows),
-            "running_workflows": len(self.running_workflows),
+            "total_workflows": len(self._workflow_defs),
+            "running_workflows": sum(len(runs) for runs in self.running_workflows.values()),
             "workflow_details": []
         }
         
         for workflow_id, state in self.workflow_states.items():
             summary["workflow_details"].append({
                 "workflow_id": workflow_id,
-                "name": state.name,
-                "status": state.status.value,
-                "current_step": state.current_step,
-                "completed_steps": len(state.completed_steps),
-                "failed_steps": len(state.failed_steps),
-                "created_at": state.created_at.isoformat(),
-                "started_at": state.started_at.isoformat() if state.started_at else None,
-                "completed_at": state.completed_at.isoformat() if state.completed_at else None
+                "name": state["name"],
+                "status": state["status"],
+                "current_step": state["current_step"],
+                "completed_steps": len(state["completed_steps"]),
+                "failed_steps": len(state["failed_steps"]),
+                "created_at": state["created_at"],
+                "started_at": state["started_at"],
+                "completed_at": state["completed_at"]
             })
         
         return summary
@@ -442,13 +613,23 @@ class AgentOrchestrator(LoggerMixin):
         """关闭编排器"""
         self.logger.info("开始关闭Agent编排器")
         
-        # 取消所有运行中的工作流
-        for workflow_id in list(self.running_workflows.keys()):
-            await self.cancel_workflow(workflow_id)
-        
-        # 停止所有Agent
-        for agent_id in list(self.agents.keys()):
-            await self.remove_agent(agent_id)
+        # 并发取消所有运行中的工作流
+        try:
+            async with asyncio.TaskGroup() as tg:
+                for workflow_id in list(self.running_workflows.keys()):
+                    tg.create_task(self.cancel_workflow(workflow_id))
+        except* Exception as eg:
+            for exc in eg.exceptions:
+                self.logger.error(f"取消工作流失败: {exc}", exc_info=exc)
+        
+        # 并发停止所有Agent
+        try:
+            async with asyncio.TaskGroup() as tg:
+                for agent_id in list(self.agents.keys()):
+                    tg.create_task(self.remove_agent(agent_id))
+        except* Exception as eg:
+            for exc in eg.exceptions:
+                self.logger.error(f"停止Agent失败: {exc}", exc_info=exc)
         
         self.logger.info("Agent编排器已关闭")
 
@@ -4,12 +4,16 @@
 """
 
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Deque, Dict, List, Optional, Union
+from collections import deque
+from dataclasses import dataclass, field
 from datetime import datetime
 import asyncio
+import itertools
+import time
 from enum import Enum
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
 from langchain_core.runnables import Runnable
 
@@ -37,39 +41,51 @@ class AgentCapability(str, Enum):
 
 class AgentTask(BaseModel):
     """Agent任务模型"""
-    id: str = Field(description="任务ID")
-    type: str = Field(description="任务类型")
-    priority: int = Field(default=1, description="优先级(1-10)")
-    payload: Dict[str, Any] = Field(default_factory=dict, description="任务数据")
-    created_at: datetime = Field(default_factory=datetime.now, description="创建时间")
-    deadline: Optional[datetime] = Field(default=None, description="截止时间")
-    dependencies: List[str] = Field(default_factory=list, description="依赖任务ID")
-    status: AgentStatus = Field(default=AgentStatus.IDLE, description="任务状态")
-    result: Optional[Dict[str, Any]] = Field(default=None, description="任务结果")
-    error: Optional[str] = Field(default=None, description="错误信息")
+    id: str  # 任务ID
+    type: str  # 任务类型
+    priority: int = 1  # 优先级(1-10)
+    payload: Dict[str, Any] = Field(default_factory=dict)  # 任务数据
+    created_at: datetime = Field(default_factory=datetime.now)  # 创建时间
+    deadline: Optional[datetime] = None  # 截止时间
+    dependencies: List[str] = Field(default_factory=list)  # 依赖任务ID
+    status: AgentStatus = AgentStatus.IDLE  # 任务状态
+    result: Optional[Dict[str, Any]] = None  # 任务结果
+    error: Optional[str] = None  # 错误信息
+
+
+# 短期记忆保留的最大消息数
+SHORT_TERM_MEMORY_SIZE = 100
 
 
 class AgentMemory(BaseModel):
     """Agent记忆模型"""
-    short_term: List[BaseMessage] = Field(default_factory=list, description="短期记忆")
-    long_term: Dict[str, Any] = Field(default_factory=dict, description="长期记忆")
-    episodic: List[Dict[str, Any]] = Field(default_factory=list, description="情节记忆")
-    semantic: Dict[str, Any] = Field(default_factory=dict, description="语义记忆")
+    short_term: Deque[BaseMessage] = Field(
+        default_factory=lambda: deque(maxlen=SHORT_TERM_MEMORY_SIZE)
+    )  # 短期记忆
+    long_term: Dict[str, Any] = Field(default_factory=dict)  # 长期记忆
+    episodic: List[Dict[str, Any]] = Field(default_factory=list)  # 情节记忆
+    semantic: Dict[str, Any] = Field(default_factory=dict)  # 语义记忆
+    
+    @field_validator("short_term", mode="after")
+    @classmethod
+    def _bound_short_term(cls, value: Deque[BaseMessage]) -> Deque[BaseMessage]:
+        """确保短期记忆为定长队列，追加时自动淘汰最旧消息"""
+        return deque(value, maxlen=SHORT_TERM_MEMORY_SIZE)
 
 
-class AgentState(BaseModel):
-    """Agent状态模型"""
-    agent_id: str = Field(description="Agent ID")
-    name: str = Field(description="Agent名称")
-    status: AgentStatus = Field(default=AgentStatus.IDLE, description="当前状态")
-    capabilities: List[AgentCapability] = Field(default_factory=list, description="能力列表")
-    current_task: Optional[AgentTask] = Field(default=None, description="当前任务")
-    task_queue: List[AgentTask] = Field(default_factory=list, description="任务队列")
-    memory: AgentMemory = Field(default_factory=AgentMemory, description="记忆系统")
-    context: Dict[str, Any] = Field(default_factory=dict, description="上下文数据")
-    metrics: Dict[str, Any] = Field(default_factory=dict, description="性能指标")
-    created_at: datetime = Field(default_factory=datetime.now, description="创建时间")
-    last_active: datetime = Field(default_factory=datetime.now, description="最后活跃时间")
+@dataclass(slots=True)
+class AgentState:
+    """Agent状态 - 运行期频繁修改，使用slots数据类避免校验开销"""
+    agent_id: str  # Agent ID
+    name: str  # Agent名称
+    status: AgentStatus = AgentStatus.IDLE  # 当前状态
+    capabilities: List[AgentCapability] = field(default_factory=list)  # 能力列表
+    current_task: Optional[AgentTask] = None  # 当前任务
+    memory: AgentMemory = field(default_factory=AgentMemory)  # 记忆系统
+    context: Dict[str, Any] = field(default_factory=dict)  # 上下文数据
+    metrics: Dict[str, Any] = field(default_factory=dict)  # 性能指标
+    created_at: datetime = field(default_factory=datetime.now)  # 创建时间
+    last_active: datetime = field(default_factory=datetime.now)  # 最后活跃时间
 
 
 class BaseAgent(ABC, LoggerMixin):
@@ -91,6 +107,10 @@ class BaseAgent(ABC, LoggerMixin):
         self._runnable: Optional[Runnable] = None
         self._is_running = False
         
+        # 任务优先级队列: (-priority, 入队序号, task)，序号保证同优先级FIFO
+        self._task_queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._task_seq = itertools.count()
+        
         # 初始化性能指标
         self.state.metrics = {
             "tasks_completed": 0,
@@ -122,6 +142,11 @@ class BaseAgent(ABC, LoggerMixin):
         """检查Agent是否正在运行"""
         return self._is_running
     
+    @property
+    def queue_size(self) -> int:
+        """获取待处理任务数量"""
+        return self._task_queue.qsize()
+    
     @abstractmethod
     async def initialize(self) -> None:
         """初始化Agent - 子类必须实现"""
@@ -168,6 +193,8 @@ class BaseAgent(ABC, LoggerMixin):
         try:
             self._is_running = False
             self.state.status = AgentStatus.IDLE
+            # 放入停止哨兵(最高优先级)，唤醒阻塞在队列上的任务处理协程
+            self._task_queue.put_nowait((float("-inf"), next(self._task_seq), None))
             await self.cleanup()
             
             self.logger.info("Agent停止成功", agent_id=self.agent_id)
@@ -179,8 +206,7 @@ class BaseAgent(ABC, LoggerMixin):
     
     async def add_task(self, task: AgentTask) -> None:
         """添加任务到队列"""
-        self.state.task_queue.append(task)
-        self.state.task_queue.sort(key=lambda t: t.priority, reverse=True)
+        await self._task_queue.put((-task.priority, next(self._task_seq), task))
         
         self.logger.info(
             "任务已添加到队列",
@@ -188,22 +214,21 @@ class BaseAgent(ABC, LoggerMixin):
             task_id=task.id,
             task_type=task.type,
             priority=task.priority,
-            queue_size=len(self.state.task_queue)
+            queue_size=self._task_queue.qsize()
         )
     
     async def _process_task_queue(self) -> None:
         """处理任务队列"""
         while self._is_running:
-            if not self.state.task_queue:
-                await asyncio.sleep(1)  # 等待新任务
+            # 阻塞等待下一个任务
+            _, _, task = await self._task_queue.get()
+            if task is None:  # 停止哨兵，由循环条件决定是否退出
                 continue
-                
-            # 获取下一个任务
-            task = self.state.task_queue.pop(0)
+            
             self.state.current_task = task
             task.status = AgentStatus.RUNNING
             
-            start_time = datetime.now()
+            start_ns = time.monotonic_ns()
             
             try:
                 self.logger.info(
@@ -221,7 +246,7 @@ class BaseAgent(ABC, LoggerMixin):
                 task.result = result
                 
                 # 更新性能指标
-                execution_time = (datetime.now() - start_time).total_seconds()
+                execution_time = (time.monotonic_ns() - start_ns) / 1e9
                 self._update_metrics(True, execution_time)
                 
                 self.logger.info(
@@ -236,7 +261,7 @@ class BaseAgent(ABC, LoggerMixin):
                 task.status = AgentStatus.FAILED
                 task.error = str(e)
                 
-                execution_time = (datetime.now() - start_time).total_seconds()
+                execution_time = (time.monotonic_ns() - start_ns) / 1e9
                 self._update_metrics(False, execution_time)
                 
                 self.logger.error(
@@ -276,7 +301,7 @@ class BaseAgent(ABC, LoggerMixin):
             "capabilities": [cap.value for cap in self.state.capabilities],
             "is_running": self._is_running,
             "current_task": self.state.current_task.dict() if self.state.current_task else None,
-            "queue_size": len(self.state.task_queue),
+            "queue_size": self._task_queue.qsize(),
             "metrics": self.state.metrics,
             "created_at": self.state.created_at.isoformat(),
             "last_active": self.state.last_active.isoformat()
@@ -291,10 +316,8 @@ class BaseAgent(ABC, LoggerMixin):
     ) -> None:
         """更新记忆"""
         if short_term is not None:
+            # 定长队列自动淘汰最旧的消息
             self.state.memory.short_term.extend(short_term)
-            # 保持短期记忆在合理大小
-            if len(self.state.memory.short_term) > 100:
-                self.state.memory.short_term = self.state.memory.short_term[-50:]
         
         if long_term is not None:
             self.state.memory.long_term.update(long_term)
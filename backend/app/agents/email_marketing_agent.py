@@ -3,23 +3,128 @@
 AI驱动的个性化邮件内容生成和发送策略优化
 """
 
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple, TypeVar, Union
 import asyncio
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from enum import Enum
-import json
+import hashlib
+import itertools
+import random
+import re
+import textwrap
+import time
 
-from pydantic import BaseModel, Field, EmailStr
+from cachetools import TTLCache
+import numpy as np
+import orjson
+from pydantic import BaseModel, Field, EmailStr, PrivateAttr
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
 import httpx
+import openai
 
 from app.agents.base_agent import BaseAgent, AgentTask, AgentCapability
 from app.core.config import settings
 from app.utils.logger import logger
 
 
+# 可重试的HTTP状态码(限流和服务端临时错误)
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+# SendGrid邮件发送接口
+SENDGRID_SEND_URL = "https://api.sendgrid.com/v3/mail/send"
+
+T = TypeVar("T")
+
+
+def _is_retryable_error(error: Exception) -> bool:
+    """判断LLM或HTTP调用异常是否值得重试"""
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, httpx.TransportError)):
+        return True
+    # httpx.HTTPStatusError 与 openai.APIStatusError 都携带 response
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None) in RETRYABLE_STATUS_CODES
+
+
+# AI响应格式："主题：..." 首行，其后为 "内容：..." 正文，标签均可省略
+AI_RESPONSE_RE = re.compile(
+    r"\s*(?:主题[:：])?[ \t]*(?P<subject>[^\n]*?)[ \t]*(?:\n\s*(?:内容[:：])?\s*(?P<content>.*?))?\s*\Z",
+    re.S
+)
+
+# 批量响应外层可能包裹的Markdown代码块标记
+AI_JSON_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+
+# A/B测试分桶数
+AB_BUCKETS = 1000
+
+
+def _ab_bucket(campaign_id: str, email: str) -> int:
+    """计算收件人的A/B分桶编号
+
+    使用blake2b而非内置hash()，后者按进程加盐，跨进程结果不一致。
+    """
+    digest = hashlib.blake2b(f"{campaign_id}:{email}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % AB_BUCKETS
+
+
+def _tokenize_template(text: str, variables: List[str]) -> Tuple[str, ...]:
+    """将模板拆分为字面量与变量名交替的片段(偶数位为字面量，奇数位为变量名)"""
+    if not variables:
+        return (text,)
+    pattern = r"\{(" + "|".join(re.escape(variable) for variable in variables) + r")\}"
+    return tuple(re.split(pattern, text))
+
+
+def _render_tokens(tokens: Tuple[str, ...], data: Dict[str, Any]) -> str:
+    """渲染预编译的模板片段，缺失的变量保留占位符"""
+    return "".join(
+        (str(data[token]) if token in data else f"{{{token}}}") if i % 2 else token
+        for i, token in enumerate(tokens)
+    )
+
+
+def _render_many(
+    subject_tokens: Tuple[str, ...],
+    content_tokens: Tuple[str, ...],
+    customers: List[Dict[str, Any]]
+) -> List[Dict[str, str]]:
+    """批量渲染模板，纯同步函数，可放入工作线程执行"""
+    return [
+        {
+            "subject": _render_tokens(subject_tokens, customer),
+            "content": _render_tokens(content_tokens, customer)
+        }
+        for customer in customers
+    ]
+
+
+# 收件人数超过该值时模板渲染移至工作线程，避免阻塞事件循环
+RENDER_IN_THREAD_THRESHOLD = 1000
+
+
+# 受众分群使用的客户数值字段
+_SEGMENT_FIELDS_DTYPE = np.dtype([
+    ("lifetime_value", "f8"),
+    ("days_since_signup", "f8"),
+    ("days_since_last_purchase", "f8"),
+    ("purchase_frequency", "f8"),
+    ("avg_discount_used", "f8")
+])
+
+# 受众分群规则：(分群名称, 字段, 比较函数, 阈值)，规则序号即标志位
+_SEGMENT_RULES = (
+    ("high_value", "lifetime_value", np.greater, 1000),  # 高价值客户
+    ("new_customers", "days_since_signup", np.less, 30),  # 新客户
+    ("inactive_customers", "days_since_last_purchase", np.greater, 90),  # 不活跃客户
+    ("frequent_buyers", "purchase_frequency", np.greater, 5),  # 频繁购买客户
+    ("price_sensitive", "avg_discount_used", np.greater, 0.15)  # 价格敏感客户
+)
+
+
 class CampaignType(str, Enum):
     """营销活动类型"""
     WELCOME = "welcome"
@@ -40,6 +145,15 @@ class EmailTemplate(BaseModel):
     content_template: str = Field(description="内容模板")
     variables: List[str] = Field(default_factory=list, description="变量列表")
     created_at: datetime = Field(default_factory=datetime.now, description="创建时间")
+    
+    # 预编译的模板片段，在Agent初始化时生成
+    _subject_tokens: Optional[Tuple[str, ...]] = PrivateAttr(default=None)
+    _content_tokens: Optional[Tuple[str, ...]] = PrivateAttr(default=None)
+    
+    def compile(self) -> None:
+        """预编译主题和内容模板"""
+        self._subject_tokens = _tokenize_template(self.subject_template, self.variables)
+        self._content_tokens = _tokenize_template(self.content_template, self.variables)
 
 
 class EmailCampaign(BaseModel):
@@ -56,19 +170,118 @@ class EmailCampaign(BaseModel):
     created_at: datetime = Field(default_factory=datetime.now, description="创建时间")
 
 
-class EmailMetrics(BaseModel):
-    """邮件指标模型"""
-    campaign_id: str = Field(description="活动ID")
-    sent_count: int = Field(default=0, description="发送数量")
-    delivered_count: int = Field(default=0, description="送达数量")
-    opened_count: int = Field(default=0, description="打开数量")
-    clicked_count: int = Field(default=0, description="点击数量")
-    unsubscribed_count: int = Field(default=0, description="取消订阅数量")
-    bounced_count: int = Field(default=0, description="退信数量")
-    open_rate: float = Field(default=0.0, description="打开率")
-    click_rate: float = Field(default=0.0, description="点击率")
-    conversion_rate: float = Field(default=0.0, description="转换率")
-    updated_at: datetime = Field(default_factory=datetime.now, description="更新时间")
+@dataclass(slots=True)
+class EmailMetrics:
+    """邮件指标 - 发送过程中频繁累加，使用slots数据类避免校验开销"""
+    campaign_id: str  # 活动ID
+    sent_count: int = 0  # 发送数量
+    delivered_count: int = 0  # 送达数量
+    opened_count: int = 0  # 打开数量
+    clicked_count: int = 0  # 点击数量
+    unsubscribed_count: int = 0  # 取消订阅数量
+    bounced_count: int = 0  # 退信数量
+    open_rate: float = 0.0  # 打开率
+    click_rate: float = 0.0  # 点击率
+    conversion_rate: float = 0.0  # 转换率
+    updated_at: datetime = field(default_factory=datetime.now)  # 更新时间
+    
+    # 序列化结果缓存，任意字段修改后失效
+    _cached_dump: Optional[Dict[str, Any]] = field(default=None, init=False, repr=False, compare=False)
+    
+    def __setattr__(self, name: str, value: Any) -> None:
+        object.__setattr__(self, name, value)
+        if name != "_cached_dump":
+            object.__setattr__(self, "_cached_dump", None)
+    
+    def update(
+        self,
+        sent: int = 0,
+        delivered: int = 0,
+        opened: int = 0,
+        clicked: int = 0,
+        unsubscribed: int = 0,
+        bounced: int = 0
+    ) -> None:
+        """累加计数并同步更新比率，读取比率时无需再计算"""
+        self.sent_count += sent
+        self.delivered_count += delivered
+        self.opened_count += opened
+        self.clicked_count += clicked
+        self.unsubscribed_count += unsubscribed
+        self.bounced_count += bounced
+        
+        if self.sent_count:
+            self.open_rate = self.opened_count / self.sent_count
+            self.click_rate = self.clicked_count / self.sent_count
+        else:
+            self.open_rate = 0.0
+            self.click_rate = 0.0
+        self.updated_at = datetime.now()
+    
+    def dump(self) -> Dict[str, Any]:
+        """获取序列化后的指标，未修改时复用上次结果"""
+        if self._cached_dump is None:
+            self._cached_dump = {
+                "campaign_id": self.campaign_id,
+                "sent_count": self.sent_count,
+                "delivered_count": self.delivered_count,
+                "opened_count": self.opened_count,
+                "clicked_count": self.clicked_count,
+                "unsubscribed_count": self.unsubscribed_count,
+                "bounced_count": self.bounced_count,
+                "open_rate": self.open_rate,
+                "click_rate": self.click_rate,
+                "conversion_rate": self.conversion_rate,
+                "updated_at": self.updated_at.isoformat()
+            }
+        return self._cached_dump
+
+
+class Rates(NamedTuple):
+    """活动比率指标，分析与建议共用同一份计算结果"""
+    open_rate: float  # 打开率
+    click_rate: float  # 点击率
+    unsubscribe_rate: float  # 取消订阅率
+
+
+# 默认模板正文在导入时去除缩进和首尾空白，渲染与发送不再携带多余空格
+WELCOME_CONTENT_TEMPLATE = textwrap.dedent("""
+    亲爱的 {customer_name}，
+
+    欢迎加入 {brand_name} 大家庭！我们很高兴您选择了我们。
+
+    作为新用户，您可以享受：
+    - 首次购买9折优惠
+    - 免费配送服务
+    - 专属客服支持
+
+    立即开始购物：{shop_url}
+
+    如有任何问题，请随时联系我们。
+
+    祝好，
+    {brand_name} 团队
+    """).strip()
+
+ABANDONED_CART_CONTENT_TEMPLATE = textwrap.dedent("""
+    亲爱的 {customer_name}，
+
+    您在 {brand_name} 的购物车中还有以下商品：
+
+    {cart_items}
+
+    总价值：{cart_total}
+
+    现在完成购买还可享受：
+    - 限时优惠码：{discount_code}
+    - 免费配送
+
+    完成购买：{checkout_url}
+
+    此优惠仅限24小时内有效。
+
+    {brand_name} 团队
+    """).strip()
 
 
 class EmailMarketingAgent(BaseAgent):
@@ -88,9 +301,21 @@ class EmailMarketingAgent(BaseAgent):
         )
         
         self.llm = None
+        # LLM并发上限，用于TPM调控
+        self._llm_semaphore = asyncio.Semaphore(settings.EMAIL_LLM_MAX_CONCURRENCY)
+        # 共享连接池的HTTP客户端，在initialize中创建、cleanup中关闭
+        self._http_client: Optional[httpx.AsyncClient] = None
         self.templates = {}
+        # 活动类型到首个匹配模板ID的索引
+        self._templates_by_type: Dict[CampaignType, str] = {}
         self.campaigns = {}
         self.metrics = {}
+        # 活动ID序列，以创建时的毫秒时间戳为起点，避免并发创建时ID冲突
+        self._campaign_ids = itertools.count(int(time.time() * 1000))
+        
+        # AI生成内容缓存及按缓存键的生成锁
+        self._ai_cache: TTLCache = TTLCache(maxsize=settings.CACHE_MAX_SIZE, ttl=settings.CACHE_TTL)
+        self._ai_cache_locks: Dict[str, asyncio.Lock] = {}
         
         # 预定义邮件模板
         self.default_templates = {
@@ -99,23 +324,7 @@ class EmailMarketingAgent(BaseAgent):
                 name="欢迎邮件模板",
                 campaign_type=CampaignType.WELCOME,
                 subject_template="欢迎加入 {brand_name}！",
-                content_template="""
-                亲爱的 {customer_name}，
-
-                欢迎加入 {brand_name} 大家庭！我们很高兴您选择了我们。
-
-                作为新用户，您可以享受：
-                - 首次购买9折优惠
-                - 免费配送服务
-                - 专属客服支持
-
-                立即开始购物：{shop_url}
-
-                如有任何问题，请随时联系我们。
-
-                祝好，
-                {brand_name} 团队
-                """,
+                content_template=WELCOME_CONTENT_TEMPLATE,
                 variables=["customer_name", "brand_name", "shop_url"]
             ),
             "abandoned_cart": EmailTemplate(
@@ -123,25 +332,7 @@ class EmailMarketingAgent(BaseAgent):
                 name="购物车提醒模板",
                 campaign_type=CampaignType.ABANDONED_CART,
                 subject_template="您的购物车还有商品等待结算",
-                content_template="""
-                亲爱的 {customer_name}，
-
-                您在 {brand_name} 的购物车中还有以下商品：
-
-                {cart_items}
-
-                总价值：{cart_total}
-
-                现在完成购买还可享受：
-                - 限时优惠码：{discount_code}
-                - 免费配送
-
-                完成购买：{checkout_url}
-
-                此优惠仅限24小时内有效。
-
-                {brand_name} 团队
-                """,
+                content_template=ABANDONED_CART_CONTENT_TEMPLATE,
                 variables=["customer_name", "brand_name", "cart_items", "cart_total", "discount_code", "checkout_url"]
             )
         }
@@ -150,20 +341,35 @@ class EmailMarketingAgent(BaseAgent):
         """初始化Agent"""
         self.logger.info("邮件营销Agent初始化中...")
         
+        # 所有外部调用复用同一连接池，避免每次请求重新握手，HTTP/2下多路复用单个连接
+        self._http_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=50),
+            timeout=httpx.Timeout(30.0, connect=5.0)
+        )
+        
         # 初始化LLM
         if settings.OPENAI_API_KEY:
+            # ChatOpenAI的http_client会同时传给同步客户端，异步客户端需单独构造
+            async_client = openai.AsyncOpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                http_client=self._http_client
+            ).chat.completions
             self.llm = ChatOpenAI(
                 api_key=settings.OPENAI_API_KEY,
                 model=settings.DEFAULT_LLM_MODEL,
-                temperature=0.7
+                temperature=0.7,
+                async_client=async_client
             )
             self.logger.info("OpenAI LLM已初始化")
         else:
             self.logger.warning("OpenAI API密钥未配置，将使用预设模板")
         
-        # 加载默认模板
+        # 加载并预编译默认模板
         for template_id, template in self.default_templates.items():
+            template.compile()
             self.templates[template_id] = template
+            self._templates_by_type.setdefault(template.campaign_type, template_id)
         
         self.logger.info("邮件营销Agent初始化完成")
     
@@ -196,6 +402,10 @@ class EmailMarketingAgent(BaseAgent):
         self.templates.clear()
         self.campaigns.clear()
         self.metrics.clear()
+        self._ai_cache.clear()
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
         self.logger.info("邮件营销Agent清理完成")
     
     async def _create_campaign(self, payload: Dict[str, Any]) -> Dict[str, Any]:
@@ -207,7 +417,8 @@ class EmailMarketingAgent(BaseAgent):
         if not campaign_name or not campaign_type:
             raise ValueError("缺少活动名称或类型")
         
-        campaign_id = f"campaign_{datetime.now().timestamp()}"
+        campaign_type = CampaignType(campaign_type)
+        campaign_id = f"campaign_{next(self._campaign_ids):x}"
         
         # 选择合适的模板
         template_id = await self._select_template(campaign_type, payload.get("template_preferences"))
@@ -216,7 +427,7 @@ class EmailMarketingAgent(BaseAgent):
         campaign = EmailCampaign(
             campaign_id=campaign_id,
             name=campaign_name,
-            campaign_type=CampaignType(campaign_type),
+            campaign_type=campaign_type,
             target_audience=target_audience,
             template_id=template_id,
             schedule=payload.get("schedule", {}),
@@ -233,8 +444,8 @@ class EmailMarketingAgent(BaseAgent):
         
         return {
             "campaign_id": campaign_id,
-            "campaign": campaign.dict(),
-            "template": self.templates[template_id].dict() if template_id in self.templates else None
+            "campaign": campaign.model_dump(mode="json"),
+            "template": self.templates[template_id].model_dump(mode="json") if template_id in self.templates else None
         }
     
     async def _generate_email_content(self, payload: Dict[str, Any]) -> Dict[str, Any]:
@@ -286,10 +497,11 @@ class EmailMarketingAgent(BaseAgent):
         
         # 更新指标
         metrics = self.metrics[campaign_id]
-        metrics.sent_count += len(recipients)
-        metrics.delivered_count += results["delivered"]
-        metrics.bounced_count += results["bounced"]
-        metrics.updated_at = datetime.now()
+        metrics.update(
+            sent=len(recipients),
+            delivered=results["delivered"],
+            bounced=results["bounced"]
+        )
         
         # 更新活动状态
         campaign.status = "sent"
@@ -306,7 +518,7 @@ class EmailMarketingAgent(BaseAgent):
             "campaign_id": campaign_id,
             "sent_count": len(recipients),
             "results": results,
-            "metrics": metrics.dict()
+            "metrics": metrics.dump()
         }
     
     async def _analyze_performance(self, payload: Dict[str, Any]) -> Dict[str, Any]:
@@ -322,19 +534,21 @@ class EmailMarketingAgent(BaseAgent):
         
         metrics = self.metrics[campaign_id]
         
-        # 计算关键指标
-        if metrics.sent_count > 0:
-            metrics.open_rate = metrics.opened_count / metrics.sent_count
-            metrics.click_rate = metrics.clicked_count / metrics.sent_count
+        # 打开率和点击率已在计数更新时维护
+        rates = Rates(
+            open_rate=metrics.open_rate,
+            click_rate=metrics.click_rate,
+            unsubscribe_rate=metrics.unsubscribed_count / max(metrics.sent_count, 1)
+        )
         
         # 生成分析报告
-        analysis = await self._generate_performance_analysis(metrics, time_range)
+        analysis = await self._generate_performance_analysis(rates, time_range)
         
         return {
             "campaign_id": campaign_id,
-            "metrics": metrics.dict(),
+            "metrics": metrics.dump(),
             "analysis": analysis,
-            "recommendations": await self._generate_recommendations(metrics)
+            "recommendations": await self._generate_recommendations(rates)
         }
     
     async def _optimize_campaign(self, payload: Dict[str, Any]) -> Dict[str, Any]:
@@ -356,7 +570,7 @@ class EmailMarketingAgent(BaseAgent):
         
         return {
             "campaign_id": campaign_id,
-            "current_performance": metrics.dict() if metrics else None,
+            "current_performance": metrics.dump() if metrics else None,
             "optimizations": optimizations
         }
     
@@ -368,36 +582,32 @@ class EmailMarketingAgent(BaseAgent):
         if not customers:
             raise ValueError("缺少客户数据")
         
-        # 基于不同标准进行分群
+        # 一次性加载数值字段为结构化数组，按列比较生成各分群掩码
+        fields = np.fromiter(
+            (
+                (
+                    customer.get("lifetime_value", 0),
+                    customer.get("days_since_signup", 0),
+                    customer.get("days_since_last_purchase", 0),
+                    customer.get("purchase_frequency", 0),
+                    customer.get("avg_discount_used", 0)
+                )
+                for customer in customers
+            ),
+            dtype=_SEGMENT_FIELDS_DTYPE,
+            count=len(customers)
+        )
+        
+        # 每个客户的分群归属压缩为一个uint8位掩码
+        flags = np.zeros(len(customers), dtype=np.uint8)
+        for bit, (_, field_name, compare, threshold) in enumerate(_SEGMENT_RULES):
+            flags[compare(fields[field_name], threshold)] |= 1 << bit
+        
         segments = {
-            "high_value": [],
-            "new_customers": [],
-            "inactive_customers": [],
-            "frequent_buyers": [],
-            "price_sensitive": []
+            segment_name: [customers[i] for i in np.flatnonzero(flags & (1 << bit))]
+            for bit, (segment_name, _, _, _) in enumerate(_SEGMENT_RULES)
         }
         
-        for customer in customers:
-            # 高价值客户
-            if customer.get("lifetime_value", 0) > 1000:
-                segments["high_value"].append(customer)
-            
-            # 新客户
-            if customer.get("days_since_signup", 0) < 30:
-                segments["new_customers"].append(customer)
-            
-            # 不活跃客户
-            if customer.get("days_since_last_purchase", 0) > 90:
-                segments["inactive_customers"].append(customer)
-            
-            # 频繁购买客户
-            if customer.get("purchase_frequency", 0) > 5:
-                segments["frequent_buyers"].append(customer)
-            
-            # 价格敏感客户
-            if customer.get("avg_discount_used", 0) > 0.15:
-                segments["price_sensitive"].append(customer)
-        
         # 为每个分群推荐营销策略
         recommendations = {}
         for segment_name, segment_customers in segments.items():
@@ -429,13 +639,15 @@ class EmailMarketingAgent(BaseAgent):
         traffic_split = test_config.get("traffic_split", [0.5, 0.5])
         recipients = payload.get("recipients", [])
         
-        # 随机分配受众
-        import random
-        random.shuffle(recipients)
-        
-        split_point = int(len(recipients) * traffic_split[0])
-        group_a = recipients[:split_point]
-        group_b = recipients[split_point:]
+        # 按邮箱哈希确定性分桶，同一收件人重复运行始终落在同一组，且不修改调用方列表
+        cutoff = int(traffic_split[0] * AB_BUCKETS)
+        group_a: List[Dict[str, Any]] = []
+        group_b: List[Dict[str, Any]] = []
+        for recipient in recipients:
+            if _ab_bucket(campaign_id, recipient.get("email", "")) < cutoff:
+                group_a.append(recipient)
+            else:
+                group_b.append(recipient)
         
         # 发送测试邮件
         results_a = await self._send_test_variant(campaign_id, variants[0], group_a, "A")
@@ -456,15 +668,15 @@ class EmailMarketingAgent(BaseAgent):
             }
         }
     
-    async def _select_template(self, campaign_type: str, preferences: Optional[Dict[str, Any]]) -> str:
+    async def _select_template(self, campaign_type: CampaignType, preferences: Optional[Dict[str, Any]]) -> str:
         """选择邮件模板"""
         # 根据活动类型选择合适的模板
-        for template_id, template in self.templates.items():
-            if template.campaign_type.value == campaign_type:
-                return template_id
+        template_id = self._templates_by_type.get(campaign_type)
+        if template_id is not None:
+            return template_id
         
         # 如果没有找到匹配的模板，返回默认模板
-        return list(self.templates.keys())[0] if self.templates else "default"
+        return next(iter(self.templates), "default")
     
     async def _generate_ai_content(
         self,
@@ -476,13 +688,69 @@ class EmailMarketingAgent(BaseAgent):
         if not self.llm:
             return await self._generate_template_content(template, customer_data)
         
+        # 相同活动类型、模板和模板变量取值的客户复用同一份生成结果
+        cache_key = self._ai_cache_key(campaign, template, customer_data)
+        cached = self._ai_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        # 同一键仅允许一个请求调用LLM，其余等待结果
+        lock = self._ai_cache_locks.setdefault(cache_key, asyncio.Lock())
+        try:
+            async with lock:
+                cached = self._ai_cache.get(cache_key)
+                if cached is not None:
+                    return cached
+                
+                content = await self._request_ai_content(campaign, template, customer_data)
+                self._ai_cache[cache_key] = content
+                return content
+            
+        except Exception as e:
+            self.logger.error(f"AI内容生成失败: {e}")
+            return await self._generate_template_content(template, customer_data)
+        
+        finally:
+            # 结果已写入缓存，后续请求直接命中缓存，无需保留锁
+            if self._ai_cache_locks.get(cache_key) is lock:
+                del self._ai_cache_locks[cache_key]
+    
+    @staticmethod
+    def _prompt_customer_data(template: EmailTemplate, customer_data: Dict[str, Any]) -> Dict[str, Any]:
+        """提示词中使用的客户信息：仅模板变量字段，与缓存键保持一致"""
+        return {k: customer_data.get(k) for k in template.variables}
+    
+    @classmethod
+    def _ai_cache_key(
+        cls,
+        campaign: EmailCampaign,
+        template: EmailTemplate,
+        customer_data: Dict[str, Any]
+    ) -> str:
+        """计算AI内容缓存键，覆盖提示词中发送的全部字段"""
+        key_data = {
+            "type": campaign.campaign_type.value,
+            "tmpl": template.template_id,
+            "cust": cls._prompt_customer_data(template, customer_data)
+        }
+        return hashlib.blake2b(
+            orjson.dumps(key_data, default=str, option=orjson.OPT_SORT_KEYS)
+        ).hexdigest()
+    
+    async def _request_ai_content(
+        self,
+        campaign: EmailCampaign,
+        template: EmailTemplate,
+        customer_data: Dict[str, Any]
+    ) -> Dict[str, str]:
+        """调用LLM生成个性化内容"""
         # 构建提示词
         prompt = ChatPromptTemplate.from_messages([
             SystemMessage(content=f"""
             你是一个专业的邮件营销专家。请根据以下信息生成个性化的邮件内容：
             
             活动类型：{campaign.campaign_type.value}
-            客户信息：{json.dumps(customer_data, ensure_ascii=False)}
+            客户信息：{orjson.dumps(self._prompt_customer_data(template, customer_data), default=str).decode()}
             
             要求：
             1. 内容要个性化且吸引人
@@ -493,23 +761,162 @@ class EmailMarketingAgent(BaseAgent):
             HumanMessage(content=f"请基于模板生成邮件主题和内容：\n主题模板：{template.subject_template}\n内容模板：{template.content_template}")
         ])
         
+        response = await self._ainvoke_with_backoff(prompt.format_messages())
+        content = response.content
+        
+        # 解析AI生成的内容：首行为主题，其余为正文
+        match = AI_RESPONSE_RE.match(content)
+        
+        return {
+            "subject": match.group("subject"),
+            "content": match.group("content") or ""
+        }
+    
+    async def _generate_ai_contents(
+        self,
+        campaign: EmailCampaign,
+        template: EmailTemplate,
+        recipients: List[Dict[str, Any]]
+    ) -> List[Dict[str, str]]:
+        """为一批收件人生成AI内容，缓存未命中的客户合并为多客户提示词批量生成"""
+        batch_size = self.config.get("ai_batch_size", 8)
+        # 单批客户信息的序列化长度上限，避免提示词超出模型上下文
+        max_batch_chars = self.config.get("ai_batch_max_chars", 8000)
+        
+        keys = [self._ai_cache_key(campaign, template, recipient) for recipient in recipients]
+        resolved: Dict[str, Dict[str, str]] = {}
+        pending: Dict[str, Dict[str, Any]] = {}
+        for key, recipient in zip(keys, recipients):
+            if key in resolved or key in pending:
+                continue
+            cached = self._ai_cache.get(key)
+            if cached is not None:
+                resolved[key] = cached
+            else:
+                pending[key] = recipient
+        
+        # 按数量和长度切分批次
+        batches: List[List[Tuple[str, Dict[str, Any], bytes]]] = []
+        current: List[Tuple[str, Dict[str, Any], bytes]] = []
+        current_chars = 0
+        for key, customer in pending.items():
+            encoded = orjson.dumps(self._prompt_customer_data(template, customer), default=str)
+            if current and (len(current) >= batch_size or current_chars + len(encoded) > max_batch_chars):
+                batches.append(current)
+                current = []
+                current_chars = 0
+            current.append((key, customer, encoded))
+            current_chars += len(encoded)
+        if current:
+            batches.append(current)
+        
+        for batch_result in await asyncio.gather(
+            *(self._generate_ai_content_batch(campaign, template, batch) for batch in batches)
+        ):
+            resolved.update(batch_result)
+        
+        return [resolved[key] for key in keys]
+    
+    async def _generate_ai_content_batch(
+        self,
+        campaign: EmailCampaign,
+        template: EmailTemplate,
+        batch: List[Tuple[str, Dict[str, Any], bytes]]
+    ) -> Dict[str, Dict[str, str]]:
+        """生成单个批次的内容，批量调用失败时退回逐个生成"""
         try:
-            response = await self.llm.ainvoke(prompt.format_messages())
-            content = response.content
-            
-            # 解析AI生成的内容
-            lines = content.strip().split('\n')
-            subject = lines[0].replace('主题：', '').strip()
-            email_content = '\n'.join(lines[1:]).replace('内容：', '').strip()
+            contents = await self._request_ai_content_batch(
+                campaign, template, [encoded for _, _, encoded in batch]
+            )
+        except Exception as e:
+            self.logger.warning(f"批量AI内容生成失败，改为逐个生成: {e}", batch_size=len(batch))
+            contents = await asyncio.gather(
+                *(self._generate_ai_content(campaign, template, customer) for _, customer, _ in batch)
+            )
+            return {key: content for (key, _, _), content in zip(batch, contents)}
+        
+        results = {}
+        for (key, _, _), content in zip(batch, contents):
+            self._ai_cache[key] = content
+            results[key] = content
+        return results
+    
+    async def _request_ai_content_batch(
+        self,
+        campaign: EmailCampaign,
+        template: EmailTemplate,
+        encoded_customers: List[bytes]
+    ) -> List[Dict[str, str]]:
+        """单次LLM调用为多个客户生成个性化内容"""
+        count = len(encoded_customers)
+        customers_json = (b"[" + b",".join(encoded_customers) + b"]").decode()
+        
+        prompt = ChatPromptTemplate.from_messages([
+            SystemMessage(content=f"""
+            你是一个专业的邮件营销专家。请根据以下信息为每位客户分别生成个性化的邮件内容：
             
-            return {
-                "subject": subject,
-                "content": email_content
-            }
+            活动类型：{campaign.campaign_type.value}
+            客户信息列表：{customers_json}
             
-        except Exception as e:
-            self.logger.error(f"AI内容生成失败: {e}")
-            return await self._generate_template_content(template, customer_data)
+            要求：
+            1. 内容要个性化且吸引人
+            2. 语调要友好专业
+            3. 包含明确的行动号召
+            4. 适合中国用户的表达习惯
+            5. 仅返回JSON数组，长度为{count}，顺序与客户信息列表一致，
+               每个元素格式为 {{"subject": "主题", "content": "内容"}}
+            """),
+            HumanMessage(content=f"请基于模板生成邮件主题和内容：\n主题模板：{template.subject_template}\n内容模板：{template.content_template}")
+        ])
+        
+        response = await self._ainvoke_with_backoff(prompt.format_messages())
+        items = orjson.loads(AI_JSON_FENCE_RE.sub("", response.content))
+        
+        if not isinstance(items, list) or len(items) != count:
+            raise ValueError(f"批量AI响应数量不匹配: 期望{count}条")
+        
+        contents = []
+        for item in items:
+            if not isinstance(item, dict) or not isinstance(item.get("subject"), str) \
+                    or not isinstance(item.get("content"), str):
+                raise ValueError("批量AI响应格式无效")
+            contents.append({"subject": item["subject"].strip(), "content": item["content"].strip()})
+        return contents
+    
+    async def _ainvoke_with_backoff(
+        self,
+        messages: List[BaseMessage],
+        max_retries: int = 5,
+        base_delay: float = 1.0
+    ) -> BaseMessage:
+        """调用LLM，遇到限流或临时错误时按指数退避重试"""
+        async def invoke() -> BaseMessage:
+            async with self._llm_semaphore:
+                return await self.llm.ainvoke(messages)
+        
+        return await self._with_backoff(invoke, "LLM调用", max_retries, base_delay)
+    
+    async def _with_backoff(
+        self,
+        operation: Callable[[], Awaitable[T]],
+        description: str,
+        max_retries: int = 5,
+        base_delay: float = 1.0
+    ) -> T:
+        """执行外部调用，遇到限流或临时错误时按指数退避重试"""
+        for attempt in range(max_retries + 1):
+            try:
+                return await operation()
+            except Exception as e:
+                if attempt == max_retries or not _is_retryable_error(e):
+                    raise
+                
+                delay = min(base_delay * (2 ** attempt) + random.random(), 60)
+                self.logger.warning(
+                    f"{description}失败，{delay:.1f}秒后重试: {e}",
+                    attempt=attempt + 1
+                )
+                await asyncio.sleep(delay)
     
     async def _generate_template_content(
         self,
@@ -517,18 +924,13 @@ class EmailMarketingAgent(BaseAgent):
         customer_data: Dict[str, Any]
     ) -> Dict[str, str]:
         """基于模板生成内容"""
-        # 填充模板变量
-        subject = template.subject_template
-        content = template.content_template
-        
-        for variable in template.variables:
-            value = customer_data.get(variable, f"{{{variable}}}")
-            subject = subject.replace(f"{{{variable}}}", str(value))
-            content = content.replace(f"{{{variable}}}", str(value))
+        if template._subject_tokens is None:
+            template.compile()
         
+        # 拼接预编译片段，缺失的变量保留占位符
         return {
-            "subject": subject,
-            "content": content
+            "subject": _render_tokens(template._subject_tokens, customer_data),
+            "content": _render_tokens(template._content_tokens, customer_data)
         }
     
     async def _batch_send_emails(
@@ -537,86 +939,114 @@ class EmailMarketingAgent(BaseAgent):
         recipients: List[Dict[str, Any]]
     ) -> Dict[str, int]:
         """批量发送邮件"""
-        delivered = 0
-        bounced = 0
+        # 活动级别的查找与分支在循环外完成一次
+        template = self.templates.get(campaign.template_id)
+        if not template:
+            raise ValueError(f"模板不存在: {campaign.template_id}")
+        if template._subject_tokens is None:
+            template.compile()
         
-        # 模拟发送过程
-        for recipient in recipients:
-            try:
-                # 生成个性化内容
-                content = await self._generate_email_content({
-                    "campaign_id": campaign.campaign_id,
-                    "customer_data": recipient
-                })
-                
-                # 模拟发送邮件
-                success = await self._send_single_email(
-                    recipient.get("email"),
-                    content["subject"],
-                    content["content"]
-                )
-                
-                if success:
-                    delivered += 1
-                else:
-                    bounced += 1
+        # 发送前一次性生成全部内容：AI内容按批请求LLM，模板内容批量渲染
+        if self.llm and campaign.personalization.get("use_ai", False):
+            contents = await self._generate_ai_contents(campaign, template, recipients)
+        elif len(recipients) > RENDER_IN_THREAD_THRESHOLD:
+            contents = await asyncio.to_thread(
+                _render_many, template._subject_tokens, template._content_tokens, recipients
+            )
+        else:
+            contents = _render_many(template._subject_tokens, template._content_tokens, recipients)
+        
+        # 限制并发发送数以匹配服务商速率限制
+        semaphore = asyncio.Semaphore(self.config.get("max_concurrent_sends", 64))
+        
+        async def send_one(recipient: Dict[str, Any], content: Dict[str, str]) -> bool:
+            async with semaphore:
+                try:
+                    return await self._send_single_email(
+                        recipient.get("email"),
+                        content["subject"],
+                        content["content"]
+                    )
                     
-            except Exception as e:
-                self.logger.error(f"发送邮件失败: {e}", recipient_email=recipient.get("email"))
-                bounced += 1
+                except Exception as e:
+                    self.logger.error(f"发送邮件失败: {e}", recipient_email=recipient.get("email"))
+                    return False
+        
+        results = await asyncio.gather(*map(send_one, recipients, contents))
+        delivered = sum(results)
         
         return {
             "delivered": delivered,
-            "bounced": bounced
+            "bounced": len(results) - delivered
         }
     
     async def _send_single_email(self, email: str, subject: str, content: str) -> bool:
-        """发送单封邮件 (模拟实现)"""
-        # 这里是模拟实现，实际需要集成邮件服务提供商API
+        """发送单封邮件，配置SendGrid密钥时经共享连接池调用API，否则模拟发送"""
         self.logger.info(f"发送邮件", email=email, subject=subject)
         
-        # 模拟90%的成功率
-        import random
-        return random.random() > 0.1
+        if not settings.SENDGRID_API_KEY or self._http_client is None:
+            # 模拟90%的成功率
+            return random.random() > 0.1
+        
+        body = orjson.dumps({
+            "personalizations": [{"to": [{"email": email}]}],
+            "from": {"email": self.config.get("from_email", "noreply@example.com")},
+            "subject": subject,
+            "content": [{"type": "text/plain", "value": content}]
+        })
+        headers = {
+            "Authorization": f"Bearer {settings.SENDGRID_API_KEY}",
+            "Content-Type": "application/json"
+        }
+        
+        async def post() -> httpx.Response:
+            response = await self._http_client.post(SENDGRID_SEND_URL, content=body, headers=headers)
+            response.raise_for_status()
+            return response
+        
+        response = await self._with_backoff(post, "邮件发送")
+        return response.status_code < 300
     
     async def _generate_performance_analysis(
         self,
-        metrics: EmailMetrics,
+        rates: Rates,
         time_range: int
     ) -> Dict[str, Any]:
         """生成性能分析"""
+        open_rate, click_rate, _ = rates
         analysis = {
-            "overall_performance": "良好" if metrics.open_rate > 0.2 else "需要改进",
+            "overall_performance": "良好" if open_rate > 0.2 else "需要改进",
             "key_insights": [],
             "trends": {}
         }
         
         # 分析关键指标
-        if metrics.open_rate > 0.25:
+        if open_rate > 0.25:
             analysis["key_insights"].append("打开率表现优秀")
-        elif metrics.open_rate < 0.15:
+        elif open_rate < 0.15:
             analysis["key_insights"].append("打开率偏低，建议优化主题行")
         
-        if metrics.click_rate > 0.05:
+        if click_rate > 0.05:
             analysis["key_insights"].append("点击率表现良好")
-        elif metrics.click_rate < 0.02:
+        elif click_rate < 0.02:
             analysis["key_insights"].append("点击率偏低，建议优化邮件内容和CTA")
         
         return analysis
     
-    async def _generate_recommendations(self, metrics: EmailMetrics) -> List[str]:
+    async def _generate_recommendations(self, rates: Rates) -> List[str]:
         """生成改进建议"""
+        open_rate, click_rate, unsubscribe_rate = rates
         recommendations = []
         
-        if metrics.open_rate < 0.2:
+        if open_rate < 0.2:
             recommendations.append("优化邮件主题行，增加个性化元素")
             recommendations.append("测试不同的发送时间")
         
-        if metrics.click_rate < 0.03:
+        if click_rate < 0.03:
             recommendations.append("改进邮件内容布局和视觉设计")
             recommendations.append("使用更明确的行动号召按钮")
         
-        if metrics.unsubscribed_count > metrics.sent_count * 0.01:
+        if unsubscribe_rate > 0.01:
             recommendations.append("检查邮件频率，避免过度发送")
             recommendations.append("提供更多价值内容")
         
@@ -3,19 +3,37 @@
 自动化包裹状态查询、异常预警和客户通知
 """
 
-from typing import Any, Dict, List, Optional
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
 import asyncio
+import time
 from datetime import datetime, timedelta
 from enum import Enum
+from types import MappingProxyType
 
+from cachetools import TTLCache
+import numpy as np
 from pydantic import BaseModel, Field
+from sortedcontainers import SortedList
 import httpx
+import orjson
+import zstandard
 
 from app.agents.base_agent import BaseAgent, AgentTask, AgentCapability
 from app.core.config import settings
 from app.utils.logger import logger
 
 
+# AfterShip API地址及批量查询每批最多跟踪号数量
+AFTERSHIP_API_BASE = "https://api.aftership.com/v4"
+
+# 自动通知批量发送：每批最多条数及最长等待秒数
+NOTIFY_BATCH_SIZE = 100
+NOTIFY_FLUSH_INTERVAL = 1.0
+
+# 跟踪信息缓存压缩级别，写入频繁，取低级别换速度
+TRACKING_BLOB_ZSTD_LEVEL = 3
+
+
 class ShipmentStatus(str, Enum):
     """包裹状态枚举"""
     PENDING = "pending"
@@ -27,6 +45,38 @@ class ShipmentStatus(str, Enum):
     CANCELLED = "cancelled"
 
 
+# AfterShip状态标签到包裹状态的映射(只读)
+AFTERSHIP_STATUS_MAP = MappingProxyType({
+    "Pending": ShipmentStatus.PENDING,
+    "InfoReceived": ShipmentStatus.PENDING,
+    "InTransit": ShipmentStatus.IN_TRANSIT,
+    "OutForDelivery": ShipmentStatus.OUT_FOR_DELIVERY,
+    "Delivered": ShipmentStatus.DELIVERED,
+    "Exception": ShipmentStatus.EXCEPTION,
+    "AttemptFail": ShipmentStatus.EXCEPTION,
+    "Expired": ShipmentStatus.EXCEPTION
+})
+
+
+# 送达预测查表：状态编码 -> 预计剩余时间、置信度和依据，未列出的状态使用最后一项
+_PREDICTION_STATUS_CODE = {
+    ShipmentStatus.DELIVERED: 0,
+    ShipmentStatus.OUT_FOR_DELIVERY: 1,
+    ShipmentStatus.IN_TRANSIT: 2
+}
+_PREDICTION_DEFAULT_CODE = 3
+_PREDICTION_OFFSETS = np.array(
+    [0, 8 * 3600, 2 * 86400, 5 * 86400], dtype="timedelta64[s]"
+).astype("timedelta64[us]")
+_PREDICTION_CONFIDENCE = np.array([1.0, 0.9, 0.7, 0.5])
+_PREDICTION_FACTORS = (
+    ("已送达",),
+    ("正在派送中", "预计当日送达"),
+    ("运输中", "基于历史数据预测"),
+    ("状态不明确", "保守估计")
+)
+
+
 class TrackingInfo(BaseModel):
     """跟踪信息模型"""
     tracking_number: str = Field(description="跟踪号")
@@ -40,6 +90,37 @@ class TrackingInfo(BaseModel):
     last_updated: datetime = Field(default_factory=datetime.now, description="最后更新时间")
 
 
+class CachedTracking(NamedTuple):
+    """缓存条目：跟踪事件只保存在压缩后的序列化结果中，避免在缓存里重复占用内存"""
+    info: TrackingInfo  # 跟踪信息(不含跟踪事件)
+    blob: bytes  # zstd压缩的model_dump(mode="json")结果
+    cached_at: float  # 写入时的time.monotonic()，用于时间范围比较
+    
+    @property
+    def data(self) -> Dict[str, Any]:
+        """解压完整的序列化跟踪信息"""
+        return orjson.loads(zstandard.decompress(self.blob))
+
+
+class EvictingTTLCache(TTLCache):
+    """过期或按容量淘汰条目时回调on_evict，供外部索引同步清理"""
+    
+    def __init__(self, maxsize: int, ttl: float, on_evict: Callable[[Any], None]):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self._on_evict = on_evict
+    
+    def popitem(self) -> Tuple[Any, Any]:
+        key, value = super().popitem()
+        self._on_evict(key)
+        return key, value
+    
+    def expire(self, time: Optional[float] = None) -> List[Tuple[Any, Any]]:
+        expired = super().expire(time)
+        for key, _ in expired:
+            self._on_evict(key)
+        return expired
+
+
 class LogisticsAgent(BaseAgent):
     """物流跟踪Agent"""
     
@@ -63,7 +144,29 @@ class LogisticsAgent(BaseAgent):
             "usps": self._track_usps
         }
         
-        self.tracking_cache = {}  # 跟踪信息缓存
+        # 跟踪信息缓存，键为(承运商, 跟踪号)，过期和容量淘汰时同步清理下方索引
+        self.tracking_cache: EvictingTTLCache = EvictingTTLCache(
+            maxsize=settings.TRACKING_CACHE_MAX,
+            ttl=settings.TRACKING_CACHE_TTL,
+            on_evict=self._drop_indexes
+        )
+        # 跟踪号到缓存键的索引，与缓存同容量同TTL，淘汰后不会无限增长
+        self._by_number: TTLCache = TTLCache(
+            maxsize=settings.TRACKING_CACHE_MAX,
+            ttl=settings.TRACKING_CACHE_TTL
+        )
+        # 异常检查索引：异常状态的缓存键集合，及未送达包裹按预计送达时间排序的(时间戳, 缓存键)
+        # 只包含缓存中的键，规模不超过TRACKING_CACHE_MAX
+        self._exception_keys: Set[Tuple[str, str]] = set()
+        self._eta_index: SortedList = SortedList()
+        self._eta_by_key: Dict[Tuple[str, str], float] = {}
+        # 自动通知队列，由后台任务按批发送
+        self._notify_queue: asyncio.Queue = asyncio.Queue()
+        self._notify_task: Optional[asyncio.Task] = None
+        # 进行中的承运商查询，相同(承运商, 跟踪号)的并发请求共享同一结果
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+        # 共享连接池的HTTP客户端，在initialize中创建、cleanup中关闭
+        self._http: Optional[httpx.AsyncClient] = None
     
     async def initialize(self) -> None:
         """初始化Agent"""
@@ -82,6 +185,19 @@ class LogisticsAgent(BaseAgent):
             else:
                 self.logger.warning(f"{carrier} API未配置")
         
+        # 所有跟踪请求复用同一连接池，避免每次查询重新进行TCP/TLS握手
+        headers = {"Content-Type": "application/json"}
+        if settings.AFTERSHIP_API_KEY:
+            headers["aftership-api-key"] = settings.AFTERSHIP_API_KEY
+        self._http = httpx.AsyncClient(
+            http2=True,
+            timeout=10.0,
+            headers=headers,
+            limits=httpx.Limits(max_keepalive_connections=100, max_connections=200)
+        )
+        
+        self._notify_task = asyncio.create_task(self._notify_flush_loop())
+        
         self.logger.info("物流跟踪Agent初始化完成")
     
     async def process_task(self, task: AgentTask) -> Dict[str, Any]:
@@ -106,7 +222,28 @@ class LogisticsAgent(BaseAgent):
     
     async def cleanup(self) -> None:
         """清理资源"""
+        # 停止通知任务并发送队列中剩余的通知
+        if self._notify_task is not None:
+            self._notify_task.cancel()
+            try:
+                await self._notify_task
+            except asyncio.CancelledError:
+                pass
+            self._notify_task = None
+        remaining = []
+        while not self._notify_queue.empty():
+            remaining.append(self._notify_queue.get_nowait())
+        if remaining:
+            await self._flush_notifications(remaining)
+        
         self.tracking_cache.clear()
+        self._by_number.clear()
+        self._exception_keys.clear()
+        self._eta_index.clear()
+        self._eta_by_key.clear()
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
         self.logger.info("物流跟踪Agent清理完成")
     
     async def _track_shipment(self, payload: Dict[str, Any]) -> Dict[str, Any]:
@@ -119,33 +256,112 @@ class LogisticsAgent(BaseAgent):
             raise ValueError("缺少跟踪号")
         
         # 检查缓存
-        cache_key = f"{carrier}_{tracking_number}"
-        if not force_refresh and cache_key in self.tracking_cache:
-            cached_info = self.tracking_cache[cache_key]
-            if (datetime.now() - cached_info.last_updated).seconds < 300:  # 5分钟缓存
+        if not force_refresh:
+            cached = self._get_cached_tracking(carrier, tracking_number)
+            if cached is not None:
                 self.logger.info(f"返回缓存的跟踪信息: {tracking_number}")
-                return {"tracking_info": cached_info.dict(), "source": "cache"}
+                return {"tracking_info": cached.data, "source": "cache"}
         
         # 调用对应承运商API
         if carrier not in self.supported_carriers:
             raise ValueError(f"不支持的承运商: {carrier}")
         
-        tracking_func = self.supported_carriers[carrier]
-        tracking_info = await tracking_func(tracking_number)
+        tracking_info = await self._fetch_tracking(carrier, tracking_number)
         
-        # 更新缓存
-        self.tracking_cache[cache_key] = tracking_info
+        return await self._record_tracking(carrier, tracking_info, payload)
+    
+    async def _fetch_tracking(self, carrier: str, tracking_number: str) -> TrackingInfo:
+        """调用承运商API查询，合并相同跟踪号的并发请求"""
+        cache_key = (carrier, tracking_number)
+        task = self._inflight.get(cache_key)
+        if task is None:
+            task = self._register_inflight(cache_key, self.supported_carriers[carrier](tracking_number))
+        
+        # 单个调用方取消时不影响其他等待者
+        return await asyncio.shield(task)
+    
+    def _register_inflight(self, cache_key: Tuple[str, str], call: Awaitable[TrackingInfo]) -> asyncio.Future:
+        """登记进行中的查询，完成后自动移除"""
+        task = asyncio.ensure_future(call)
+        self._inflight[cache_key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(cache_key, None))
+        return task
+    
+    def _get_cached_tracking(self, carrier: str, tracking_number: str) -> Optional[CachedTracking]:
+        """获取未过期的缓存跟踪信息"""
+        return self.tracking_cache.get((carrier, tracking_number))
+    
+    async def _record_tracking(
+        self,
+        carrier: str,
+        tracking_info: TrackingInfo,
+        payload: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """缓存API返回的跟踪信息，并在需要时通知客户"""
+        data = self._cache_tracking(carrier, tracking_info)
         
         # 检查是否需要发送通知
         if tracking_info.status in [ShipmentStatus.DELIVERED, ShipmentStatus.EXCEPTION]:
             await self._auto_notify_customer(tracking_info, payload.get("customer_info"))
         
         return {
-            "tracking_info": tracking_info.dict(),
+            "tracking_info": data,
             "source": "api",
             "carrier": carrier
         }
     
+    def _cache_tracking(self, carrier: str, tracking_info: TrackingInfo) -> Dict[str, Any]:
+        """写入跟踪信息缓存及跟踪号索引，返回只序列化一次的跟踪信息"""
+        cache_key = (carrier, tracking_info.tracking_number)
+        data = tracking_info.model_dump(mode="json")
+        self.tracking_cache[cache_key] = CachedTracking(
+            tracking_info.model_copy(update={"tracking_events": []}),
+            zstandard.compress(orjson.dumps(data), TRACKING_BLOB_ZSTD_LEVEL),
+            time.monotonic()
+        )
+        self._by_number[tracking_info.tracking_number] = cache_key
+        
+        # 同步维护异常检查索引
+        if tracking_info.status == ShipmentStatus.EXCEPTION:
+            self._exception_keys.add(cache_key)
+        else:
+            self._exception_keys.discard(cache_key)
+        
+        self._remove_eta(cache_key)
+        if tracking_info.estimated_delivery and tracking_info.status != ShipmentStatus.DELIVERED:
+            eta = tracking_info.estimated_delivery.timestamp()
+            self._eta_index.add((eta, cache_key))
+            self._eta_by_key[cache_key] = eta
+        
+        return data
+    
+    def _remove_eta(self, cache_key: Tuple[str, str]) -> None:
+        """从预计送达时间索引中移除缓存键"""
+        eta = self._eta_by_key.pop(cache_key, None)
+        if eta is not None:
+            self._eta_index.discard((eta, cache_key))
+    
+    def _drop_indexes(self, cache_key: Tuple[str, str]) -> None:
+        """缓存条目被淘汰时清除其索引"""
+        self._exception_keys.discard(cache_key)
+        self._remove_eta(cache_key)
+        if self._by_number.get(cache_key[1]) == cache_key:
+            del self._by_number[cache_key[1]]
+    
+    async def apply_webhook_update(self, payload: Dict[str, Any]) -> Optional[TrackingInfo]:
+        """应用AfterShip Webhook推送的状态变化，直接刷新缓存"""
+        data = payload.get("msg") or {}
+        tracking_number = data.get("tracking_number")
+        if not tracking_number:
+            self.logger.warning("Webhook缺少跟踪号", event=payload.get("event"))
+            return None
+        
+        tracking_info = self._parse_aftership_tracking(tracking_number, data)
+        self._cache_tracking("aftership", tracking_info)
+        
+        self.logger.info(f"Webhook更新跟踪信息: {tracking_number}", status=tracking_info.status.value)
+        return tracking_info
+    
     async def _batch_track(self, payload: Dict[str, Any]) -> Dict[str, Any]:
         """批量跟踪包裹"""
         tracking_requests = payload.get("tracking_requests", [])
@@ -154,15 +370,68 @@ class LogisticsAgent(BaseAgent):
             raise ValueError("缺少跟踪请求")
         
         results = []
+        tracking_results: List[Any] = [None] * len(tracking_requests)
+        
+        # 先统一检查缓存，AfterShip未命中的跟踪号按号归并等待批量查询
+        aftership_pending: Dict[str, List[int]] = {}
+        single_indices: List[int] = []
+        bulk_enabled = bool(settings.AFTERSHIP_API_KEY) and self._http is not None
+        for i, request in enumerate(tracking_requests):
+            tracking_number = request.get("tracking_number")
+            carrier = request.get("carrier", "aftership")
+            cached = None
+            if tracking_number and not request.get("force_refresh", False):
+                cached = self._get_cached_tracking(carrier, tracking_number)
+            
+            if cached is not None:
+                tracking_results[i] = {"tracking_info": cached.data, "source": "cache"}
+            elif tracking_number and carrier == "aftership" and bulk_enabled:
+                aftership_pending.setdefault(tracking_number, []).append(i)
+            else:
+                single_indices.append(i)
+        
+        # 限制同时进行的承运商请求数，避免触发限流
+        semaphore = asyncio.Semaphore(settings.LOGISTICS_MAX_CONCURRENCY)
+        
+        async def bounded(call: Awaitable[Any]) -> Any:
+            async with semaphore:
+                return await call
+        
+        # AfterShip按批查询，N次请求合并为 ceil(N/批大小) 次
+        # 已有进行中查询的跟踪号直接等待；批量查询的跟踪号登记到_inflight，与同时发起的单个查询合并
+        lookups: Dict[str, asyncio.Future] = {}
+        numbers: List[str] = []
+        for tracking_number in aftership_pending:
+            task = self._inflight.get(("aftership", tracking_number))
+            if task is None:
+                numbers.append(tracking_number)
+            else:
+                lookups[tracking_number] = task
+        
+        bulk_size = settings.AFTERSHIP_BULK_SIZE
+        for start in range(0, len(numbers), bulk_size):
+            chunk = numbers[start:start + bulk_size]
+            bulk = asyncio.ensure_future(bounded(self._track_aftership_chunk(chunk)))
+            for tracking_number in chunk:
+                lookups[tracking_number] = self._register_inflight(
+                    ("aftership", tracking_number),
+                    self._bulk_lookup(bulk, tracking_number, semaphore)
+                )
+        
+        async def record(lookup: asyncio.Future, request: Dict[str, Any]) -> Dict[str, Any]:
+            return await self._record_tracking("aftership", await asyncio.shield(lookup), request)
         
-        # 并发处理多个跟踪请求
-        tasks = []
-        for request in tracking_requests:
-            task = self._track_shipment(request)
-            tasks.append(task)
+        calls: Dict[int, Any] = {}
+        for tracking_number, lookup in lookups.items():
+            for i in aftership_pending[tracking_number]:
+                calls[i] = record(lookup, tracking_requests[i])
         
-        # 等待所有任务完成
-        tracking_results = await asyncio.gather(*tasks, return_exceptions=True)
+        for i in single_indices:
+            calls[i] = bounded(self._track_shipment(tracking_requests[i]))
+        
+        # 并发处理剩余请求并等待完成
+        for i, result in zip(calls, await asyncio.gather(*calls.values(), return_exceptions=True)):
+            tracking_results[i] = result
         
         for i, result in enumerate(tracking_results):
             if isinstance(result, Exception):
@@ -185,42 +454,81 @@ class LogisticsAgent(BaseAgent):
             "failed_requests": sum(1 for r in results if not r.get("success"))
         }
     
+    async def _track_aftership_chunk(self, tracking_numbers: List[str]) -> Dict[str, TrackingInfo]:
+        """批量查询一批跟踪号，失败时返回空结果由各跟踪号逐个查询"""
+        try:
+            return await self._track_aftership_bulk(tracking_numbers)
+        except Exception as e:
+            self.logger.warning(f"AfterShip批量查询失败，改为逐个查询: {e}", count=len(tracking_numbers))
+            return {}
+    
+    async def _bulk_lookup(
+        self,
+        bulk: Awaitable[Dict[str, TrackingInfo]],
+        tracking_number: str,
+        semaphore: asyncio.Semaphore
+    ) -> TrackingInfo:
+        """从批量结果中取出单个跟踪号，缺失时退回单个查询"""
+        tracking_info = (await bulk).get(tracking_number)
+        if tracking_info is None:
+            async with semaphore:
+                tracking_info = await self.supported_carriers["aftership"](tracking_number)
+        return tracking_info
+    
     async def _check_exceptions(self, payload: Dict[str, Any]) -> Dict[str, Any]:
         """检查异常包裹"""
         time_range = payload.get("time_range", 24)  # 小时
         
-        exceptions = []
+        # 按缓存键合并，既异常又延误的包裹只出现一次
+        exceptions: Dict[Tuple[str, str], Dict[str, Any]] = {}
         current_time = datetime.now()
-        
-        # 遍历缓存中的跟踪信息
-        for cache_key, tracking_info in self.tracking_cache.items():
-            # 检查是否在时间范围内
-            if (current_time - tracking_info.last_updated).total_seconds() > time_range * 3600:
+        now_ts = current_time.timestamp()
+        # 时间范围用单调时钟比较，避免逐条构造datetime/timedelta
+        oldest_cached_at = time.monotonic() - time_range * 3600
+        # 已过期但TTLCache尚未清理的键，检查后从索引中清除
+        evicted: List[Tuple[str, str]] = []
+        
+        # 只访问索引命中的条目，不遍历整个缓存
+        for cache_key in self._exception_keys:
+            cached = self.tracking_cache.get(cache_key)
+            if cached is None:
+                evicted.append(cache_key)
                 continue
+            if cached.cached_at < oldest_cached_at:
+                continue
+            tracking_info = cached.info
             
-            # 检查异常状态
-            if tracking_info.status == ShipmentStatus.EXCEPTION:
-                exceptions.append({
-                    "tracking_number": tracking_info.tracking_number,
-                    "carrier": tracking_info.carrier,
-                    "exception_info": tracking_info.exception_info,
-                    "last_updated": tracking_info.last_updated.isoformat()
-                })
+            exceptions[cache_key] = {
+                "tracking_number": tracking_info.tracking_number,
+                "carrier": tracking_info.carrier,
+                "exception_info": tracking_info.exception_info,
+                "last_updated": tracking_info.last_updated.isoformat()
+            }
+        
+        # 检查延误情况：预计送达时间早于当前时间的未送达包裹
+        for eta, cache_key in self._eta_index.irange(maximum=(now_ts,), inclusive=(True, False)):
+            cached = self.tracking_cache.get(cache_key)
+            if cached is None:
+                evicted.append(cache_key)
+                continue
+            if cached.cached_at < oldest_cached_at:
+                continue
+            tracking_info = cached.info
             
-            # 检查延误情况
-            if (tracking_info.estimated_delivery and 
-                current_time > tracking_info.estimated_delivery and
-                tracking_info.status not in [ShipmentStatus.DELIVERED]):
-                exceptions.append({
-                    "tracking_number": tracking_info.tracking_number,
-                    "carrier": tracking_info.carrier,
-                    "exception_info": "包裹延误",
-                    "estimated_delivery": tracking_info.estimated_delivery.isoformat(),
-                    "delay_hours": (current_time - tracking_info.estimated_delivery).total_seconds() / 3600
-                })
+            entry = exceptions.setdefault(cache_key, {
+                "tracking_number": tracking_info.tracking_number,
+                "carrier": tracking_info.carrier,
+                "exception_info": "包裹延误"
+            })
+            entry["estimated_delivery"] = tracking_info.estimated_delivery.isoformat()
+            entry["delay_hours"] = (now_ts - eta) / 3600
+        
+        for cache_key in evicted:
+            self._exception_keys.discard(cache_key)
+            self._remove_eta(cache_key)
         
         return {
-            "exceptions": exceptions,
+            "exceptions": list(exceptions.values()),
             "total_exceptions": len(exceptions),
             "check_time": current_time.isoformat()
         }
@@ -285,43 +593,44 @@ class LogisticsAgent(BaseAgent):
         if not settings.AFTERSHIP_API_KEY:
             raise ValueError("AfterShip API密钥未配置")
         
-        headers = {
-            "aftership-api-key": settings.AFTERSHIP_API_KEY,
-            "Content-Type": "application/json"
-        }
+        if self._http is None:
+            raise ValueError("HTTP客户端未初始化")
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"https://api.aftership.com/v4/trackings/{tracking_number}",
-                headers=headers
-            )
-            
-            if response.status_code != 200:
-                raise Exception(f"AfterShip API错误: {response.status_code}")
-            
-            data = response.json()["data"]["tracking"]
-            
-            # 解析响应数据
-            status_map = {
-                "Pending": ShipmentStatus.PENDING,
-                "InfoReceived": ShipmentStatus.PENDING,
-                "InTransit": ShipmentStatus.IN_TRANSIT,
-                "OutForDelivery": ShipmentStatus.OUT_FOR_DELIVERY,
-                "Delivered": ShipmentStatus.DELIVERED,
-                "Exception": ShipmentStatus.EXCEPTION,
-                "AttemptFail": ShipmentStatus.EXCEPTION,
-                "Expired": ShipmentStatus.EXCEPTION
-            }
-            
-            return TrackingInfo(
-                tracking_number=tracking_number,
-                carrier=data.get("slug", "unknown"),
-                status=status_map.get(data.get("tag"), ShipmentStatus.PENDING),
-                current_location=data.get("origin_country_iso3"),
-                estimated_delivery=self._parse_datetime(data.get("expected_delivery")),
-                tracking_events=data.get("checkpoints", []),
-                last_updated=datetime.now()
-            )
+        response = await self._http.get(f"{AFTERSHIP_API_BASE}/trackings/{tracking_number}")
+        
+        if response.status_code != 200:
+            raise Exception(f"AfterShip API错误: {response.status_code}")
+        
+        return self._parse_aftership_tracking(tracking_number, response.json()["data"]["tracking"])
+    
+    async def _track_aftership_bulk(self, tracking_numbers: List[str]) -> Dict[str, TrackingInfo]:
+        """一次请求查询多个AfterShip跟踪号，返回按跟踪号索引的跟踪信息"""
+        response = await self._http.get(
+            f"{AFTERSHIP_API_BASE}/trackings",
+            params={"tracking_numbers": ",".join(tracking_numbers), "limit": len(tracking_numbers)}
+        )
+        
+        if response.status_code != 200:
+            raise Exception(f"AfterShip API错误: {response.status_code}")
+        
+        wanted = set(tracking_numbers)
+        return {
+            data["tracking_number"]: self._parse_aftership_tracking(data["tracking_number"], data)
+            for data in response.json()["data"]["trackings"]
+            if data.get("tracking_number") in wanted
+        }
+    
+    def _parse_aftership_tracking(self, tracking_number: str, data: Dict[str, Any]) -> TrackingInfo:
+        """解析AfterShip跟踪数据"""
+        return TrackingInfo(
+            tracking_number=tracking_number,
+            carrier=data.get("slug", "unknown"),
+            status=AFTERSHIP_STATUS_MAP.get(data.get("tag"), ShipmentStatus.PENDING),
+            current_location=data.get("origin_country_iso3"),
+            estimated_delivery=self._parse_datetime(data.get("expected_delivery")),
+            tracking_events=data.get("checkpoints", []),
+            last_updated=datetime.now()
+        )
     
     async def _track_fedex(self, tracking_number: str) -> TrackingInfo:
         """使用FedEx API跟踪包裹 (模拟实现)"""
@@ -410,26 +719,62 @@ class LogisticsAgent(BaseAgent):
     async def _get_tracking_info(self, tracking_number: str) -> TrackingInfo:
         """获取跟踪信息"""
         # 首先尝试从缓存获取
-        for cache_key, tracking_info in self.tracking_cache.items():
-            if tracking_info.tracking_number == tracking_number:
-                return tracking_info
+        cache_key = self._by_number.get(tracking_number)
+        if cache_key is not None:
+            cached = self.tracking_cache.get(cache_key)
+            if cached is not None:
+                # 缓存中的跟踪信息不含跟踪事件，通知和预测无需事件明细
+                return cached.info
         
         # 如果缓存中没有，尝试跟踪
         result = await self._track_shipment({"tracking_number": tracking_number})
-        return TrackingInfo(**result["tracking_info"])
+        return TrackingInfo.model_validate(result["tracking_info"])
     
     async def _auto_notify_customer(self, tracking_info: TrackingInfo, customer_info: Optional[Dict[str, Any]]):
         """自动通知客户"""
         if not customer_info or not customer_info.get("email"):
             return
         
-        notification_type = "delivery" if tracking_info.status == ShipmentStatus.DELIVERED else "exception"
-        
-        await self._notify_customer({
-            "tracking_number": tracking_info.tracking_number,
-            "customer_email": customer_info["email"],
-            "notification_type": notification_type
-        })
+        # 放入队列，由后台任务合并发送
+        self._notify_queue.put_nowait((tracking_info, customer_info["email"]))
+    
+    async def _notify_flush_loop(self) -> None:
+        """后台按批发送通知：凑满一批或等待超时后发送"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._notify_queue.get()]
+            try:
+                deadline = loop.time() + NOTIFY_FLUSH_INTERVAL
+                while len(batch) < NOTIFY_BATCH_SIZE:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._notify_queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            finally:
+                # 被取消时也发送已取出的通知
+                await self._flush_notifications(batch)
+    
+    async def _flush_notifications(self, batch: List[Tuple[TrackingInfo, str]]) -> None:
+        """批量发送客户通知"""
+        try:
+            notifications = []
+            for tracking_info, customer_email in batch:
+                notification_type = "delivery" if tracking_info.status == ShipmentStatus.DELIVERED else "exception"
+                notifications.append({
+                    "tracking_number": tracking_info.tracking_number,
+                    "customer_email": customer_email,
+                    "notification_type": notification_type,
+                    "content": await self._generate_notification_content(tracking_info, notification_type)
+                })
+            
+            # 批量发送通知 (这里模拟发送，实际需要集成邮件服务的批量接口)
+            self.logger.info(f"批量发送客户通知", count=len(notifications))
+            
+        except Exception as e:
+            self.logger.error(f"批量发送客户通知失败: {e}", count=len(batch))
     
     async def _generate_notification_content(self, tracking_info: TrackingInfo, notification_type: str) -> str:
         """生成通知内容"""
@@ -444,43 +789,40 @@ class LogisticsAgent(BaseAgent):
     
     async def _calculate_delivery_prediction(self, tracking_info: TrackingInfo) -> Dict[str, Any]:
         """计算送达预测"""
+        return (await self._calculate_delivery_predictions([tracking_info]))[0]
+    
+    async def _calculate_delivery_predictions(self, infos: List[TrackingInfo]) -> List[Dict[str, Any]]:
+        """批量计算送达预测，按状态编码查表后向量化计算预计送达时间"""
         # 简单的预测逻辑
-        base_time = datetime.now()
-        
-        if tracking_info.status == ShipmentStatus.DELIVERED:
-            return {
-                "estimated_delivery": tracking_info.actual_delivery.isoformat(),
-                "confidence": 1.0,
-                "factors": ["已送达"]
-            }
-        elif tracking_info.status == ShipmentStatus.OUT_FOR_DELIVERY:
-            estimated = base_time + timedelta(hours=8)
-            return {
-                "estimated_delivery": estimated.isoformat(),
-                "confidence": 0.9,
-                "factors": ["正在派送中", "预计当日送达"]
-            }
-        elif tracking_info.status == ShipmentStatus.IN_TRANSIT:
-            estimated = base_time + timedelta(days=2)
-            return {
-                "estimated_delivery": estimated.isoformat(),
-                "confidence": 0.7,
-                "factors": ["运输中", "基于历史数据预测"]
-            }
-        else:
-            estimated = base_time + timedelta(days=5)
-            return {
-                "estimated_delivery": estimated.isoformat(),
-                "confidence": 0.5,
-                "factors": ["状态不明确", "保守估计"]
-            }
+        codes = np.fromiter(
+            (_PREDICTION_STATUS_CODE.get(info.status, _PREDICTION_DEFAULT_CODE) for info in infos),
+            dtype=np.int8,
+            count=len(infos)
+        )
+        base_time = np.datetime64(datetime.now(), "us")
+        estimated = np.datetime_as_string(base_time + _PREDICTION_OFFSETS[codes], unit="us")
+        confidences = _PREDICTION_CONFIDENCE[codes]
+        
+        predictions = []
+        for info, code, estimated_delivery, confidence in zip(infos, codes.tolist(), estimated, confidences.tolist()):
+            # 已送达包裹使用实际送达时间
+            if info.status == ShipmentStatus.DELIVERED and info.actual_delivery:
+                estimated_delivery = info.actual_delivery.isoformat()
+            predictions.append({
+                "estimated_delivery": str(estimated_delivery),
+                "confidence": confidence,
+                "factors": list(_PREDICTION_FACTORS[code])
+            })
+        return predictions
     
     def _parse_datetime(self, date_str: Optional[str]) -> Optional[datetime]:
         """解析日期时间字符串"""
         if not date_str:
             return None
         
+        # Python 3.11起fromisoformat为C实现且直接支持末尾的Z，无需先替换字符串
         try:
-            return datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-        except:
+            return datetime.fromisoformat(date_str)
+        except (TypeError, ValueError):
+            # 上游可能返回非字符串(如时间戳数字)，同样视为无法解析
             return None
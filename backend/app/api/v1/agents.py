@@ -4,17 +4,31 @@ Agent的创建、监控和管理
 """
 
 from typing import Any, Dict, List, Optional
-from fastapi import APIRouter, HTTPException, Query
+import uuid
+
+from fastapi import APIRouter, HTTPException, Query, Response
 from pydantic import BaseModel, Field
+import orjson
 
 from app.agents.agent_orchestrator import orchestrator
 from app.agents.base_agent import AgentCapability, AgentTask
-from app.agents.logistics_agent import LogisticsAgent
-from app.agents.email_marketing_agent import EmailMarketingAgent
 from app.utils.logger import logger
 
 router = APIRouter()
 
+# 能力列表在运行期不变，导入时序列化一次
+_CAPABILITIES_PAYLOAD = orjson.dumps({
+    "capabilities": [cap.value for cap in AgentCapability],
+    "descriptions": {
+        "perception": "感知能力 - 处理多模态输入",
+        "planning": "规划能力 - 任务分解和调度",
+        "tool_use": "工具使用 - 调用外部API和服务",
+        "knowledge": "知识检索 - 访问知识库和文档",
+        "memory": "记忆管理 - 存储和检索历史信息",
+        "communication": "通信交流 - 与用户和其他Agent交互"
+    }
+})
+
 
 class CreateAgentRequest(BaseModel):
     """创建Agent请求"""
@@ -31,15 +45,6 @@ class ExecuteTaskRequest(BaseModel):
     priority: int = Field(default=1, description="优先级")
 
 
-# 注册Agent类型
-@router.on_event("startup")
-async def register_agent_types():
-    """注册Agent类型"""
-    orchestrator.register_agent_type("logistics", LogisticsAgent)
-    orchestrator.register_agent_type("email_marketing", EmailMarketingAgent)
-    logger.info("Agent类型注册完成")
-
-
 @router.post("/create")
 async def create_agent(request: CreateAgentRequest) -> Dict[str, Any]:
     """创建Agent"""
@@ -76,11 +81,11 @@ async def create_agent(request: CreateAgentRequest) -> Dict[str, Any]:
 
 
 @router.get("/list")
-async def list_agents() -> Dict[str, Any]:
+async def list_agents() -> Response:
     """获取Agent列表"""
     try:
         summary = await orchestrator.get_agent_status_summary()
-        return summary
+        return Response(content=summary, media_type="application/json")
     except Exception as e:
         logger.error(f"获取Agent列表失败: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -113,7 +118,7 @@ async def execute_agent_task(agent_id: str, request: ExecuteTaskRequest) -> Dict
         
         # 创建任务
         task = AgentTask(
-            id=f"{agent_id}_{request.task_type}_{len(agent.state.task_queue) + 1}",
+            id=f"{agent_id}_{request.task_type}_{uuid.uuid4().hex}",
             type=request.task_type,
             priority=request.priority,
             payload=request.payload
@@ -188,17 +193,6 @@ async def get_agent_types() -> Dict[str, Any]:
 
 
 @router.get("/capabilities")
-async def get_agent_capabilities() -> Dict[str, Any]:
+async def get_agent_capabilities() -> Response:
     """获取Agent能力列表"""
-    capabilities = [cap.value for cap in AgentCapability]
-    return {
-        "capabilities": capabilities,
-        "descriptions": {
-            "perception": "感知能力 - 处理多模态输入",
-            "planning": "规划能力 - 任务分解和调度",
-            "tool_use": "工具使用 - 调用外部API和服务",
-            "knowledge": "知识检索 - 访问知识库和文档",
-            "memory": "记忆管理 - 存储和检索历史信息",
-            "communication": "通信交流 - 与用户和其他Agent交互"
-        }
-    }
+    return Response(content=_CAPABILITIES_PAYLOAD, media_type="application/json")
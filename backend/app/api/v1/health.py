@@ -4,7 +4,9 @@
 """
 
 from fastapi import APIRouter, HTTPException
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
+import asyncio
+import time
 
 from app.core.database import check_database_health
 from app.agents.agent_orchestrator import orchestrator
@@ -12,6 +14,12 @@ from app.utils.logger import logger
 
 router = APIRouter()
 
+# 详细健康检查结果缓存时长(秒)，同一时间窗口内的探针请求共享一次检查结果
+HEALTH_CACHE_TTL = 1.0
+
+_health_cache: Optional[Tuple[float, Dict[str, Any]]] = None
+_health_lock = asyncio.Lock()
+
 
 @router.get("/health")
 async def health_check() -> Dict[str, Any]:
@@ -26,40 +34,62 @@ async def health_check() -> Dict[str, Any]:
 @router.get("/health/detailed")
 async def detailed_health_check() -> Dict[str, Any]:
     """详细健康检查"""
+    global _health_cache
+    
     try:
-        # 检查数据库连接
-        db_health = await check_database_health()
-        
-        # 检查Agent状态
-        agent_summary = await orchestrator.get_agent_status_summary()
-        
-        # 检查工作流状态
-        workflow_summary = await orchestrator.get_workflow_summary()
-        
-        overall_status = "healthy"
-        if not all(db_health.values()):
-            overall_status = "degraded"
-        
-        return {
-            "status": overall_status,
-            "timestamp": "2024-01-01T00:00:00Z",
-            "databases": db_health,
-            "agents": {
-                "total": agent_summary["total_agents"],
-                "running": agent_summary["running_agents"],
-                "failed": agent_summary["failed_agents"]
-            },
-            "workflows": {
-                "total": workflow_summary["total_workflows"],
-                "running": workflow_summary["running_workflows"]
-            }
-        }
+        async with _health_lock:
+            if _health_cache is not None and time.monotonic() - _health_cache[0] < HEALTH_CACHE_TTL:
+                return _health_cache[1]
+            
+            result = await _collect_detailed_health()
+            _health_cache = (time.monotonic(), result)
+            return result
         
     except Exception as e:
         logger.error(f"健康检查失败: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="健康检查失败")
 
 
+async def _collect_detailed_health() -> Dict[str, Any]:
+    """执行详细健康检查"""
+    # 并发检查数据库连接、Agent状态和工作流状态
+    db_health, agent_summary, workflow_summary = await asyncio.gather(
+        check_database_health(),
+        orchestrator.get_agent_status_summary_dict(),
+        orchestrator.get_workflow_summary_dict(),
+        return_exceptions=True
+    )
+    
+    # Agent和工作流摘要失败时整体检查失败
+    for summary in (agent_summary, workflow_summary):
+        if isinstance(summary, BaseException):
+            raise summary
+    
+    # 数据库检查失败视为降级
+    if isinstance(db_health, BaseException):
+        logger.error(f"数据库健康检查失败: {db_health}")
+        db_health = {}
+    
+    overall_status = "healthy"
+    if not db_health or not all(db_health.values()):
+        overall_status = "degraded"
+    
+    return {
+        "status": overall_status,
+        "timestamp": "2024-01-01T00:00:00Z",
+        "databases": db_health,
+        "agents": {
+            "total": agent_summary["total_agents"],
+            "running": agent_summary["running_agents"],
+            "failed": agent_summary["failed_agents"]
+        },
+        "workflows": {
+            "total": workflow_summary["total_workflows"],
+            "running": workflow_summary["running_workflows"]
+        }
+    }
+
+
 @router.get("/health/databases")
 async def database_health() -> Dict[str, Any]:
     """数据库健康检查"""
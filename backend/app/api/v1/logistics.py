@@ -0,0 +1,64 @@
+"""
+物流跟踪API
+承运商Webhook回调
+"""
+
+from typing import Any, Dict, Optional
+import base64
+import hashlib
+import hmac
+
+from fastapi import APIRouter, Header, HTTPException, Request
+import orjson
+
+from app.agents.agent_orchestrator import orchestrator
+from app.agents.logistics_agent import LogisticsAgent
+from app.core.config import settings
+from app.utils.logger import logger
+
+router = APIRouter()
+
+
+def _verify_aftership_signature(secret: str, body: bytes, signature: Optional[str]) -> bool:
+    """校验AfterShip Webhook签名"""
+    if not signature:
+        return False
+    
+    digest = hmac.new(secret.encode(), body, hashlib.sha256).digest()
+    return hmac.compare_digest(base64.b64encode(digest).decode(), signature)
+
+
+@router.post("/webhook/aftership")
+async def aftership_webhook(
+    request: Request,
+    aftership_hmac_sha256: Optional[str] = Header(default=None)
+) -> Dict[str, Any]:
+    """接收AfterShip状态变化推送并刷新物流Agent缓存"""
+    # 该接口会直接写入跟踪缓存，未配置签名密钥时拒绝所有请求
+    secret = settings.AFTERSHIP_WEBHOOK_SECRET
+    if not secret:
+        raise HTTPException(status_code=503, detail="Webhook未配置")
+    
+    body = await request.body()
+    if not _verify_aftership_signature(secret, body, aftership_hmac_sha256):
+        raise HTTPException(status_code=401, detail="Webhook签名无效")
+    
+    try:
+        payload = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Webhook数据格式无效")
+    
+    try:
+        updated = 0
+        for agent in orchestrator.agents.values():
+            if isinstance(agent, LogisticsAgent) and await agent.apply_webhook_update(payload):
+                updated += 1
+        
+        return {
+            "success": True,
+            "updated_agents": updated
+        }
+        
+    except Exception as e:
+        logger.error(f"处理AfterShip Webhook失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
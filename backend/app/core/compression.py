@@ -0,0 +1,189 @@
+"""
+响应压缩中间件
+按Accept-Encoding协商zstd/br/gzip，大响应体在线程池中压缩
+"""
+
+import asyncio
+import zlib
+from functools import lru_cache
+from typing import Any, Callable, NamedTuple, Optional
+
+import brotli
+import zstandard
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+ZSTD_LEVEL = 3
+BROTLI_QUALITY = 4  # brotli默认质量11过慢，不适合在线压缩
+GZIP_LEVEL = 6
+
+# 完整响应体超过该大小时放到线程池压缩，避免阻塞事件循环
+COMPRESS_IN_THREAD_THRESHOLD = 64 * 1024
+
+# 服务端优先顺序
+ENCODING_PREFERENCE = ("zstd", "br", "gzip")
+
+
+class _BrotliStream:
+    """将brotli增量压缩器适配为compress/flush接口"""
+
+    __slots__ = ("_compressor",)
+
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _Codec(NamedTuple):
+    """一次性压缩函数与增量压缩器工厂"""
+    compress: Callable[[bytes], bytes]
+    stream: Callable[[], Any]
+
+
+CODECS = {
+    "zstd": _Codec(
+        compress=lambda data: zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data),
+        stream=lambda: zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj(),
+    ),
+    "br": _Codec(
+        compress=lambda data: brotli.compress(data, quality=BROTLI_QUALITY),
+        stream=_BrotliStream,
+    ),
+    "gzip": _Codec(
+        compress=lambda data: zlib.compress(data, GZIP_LEVEL, wbits=31),
+        stream=lambda: zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31),
+    ),
+}
+
+
+@lru_cache(maxsize=256)
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """根据Accept-Encoding选择编码，客户端发送的取值种类有限，结果可缓存"""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.partition(";")
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip())
+
+    for encoding in ENCODING_PREFERENCE:
+        if encoding in accepted:
+            return encoding
+    return None
+
+
+class CompressionMiddleware:
+    """zstd/brotli/gzip响应压缩，替代仅支持gzip的GZipMiddleware"""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1000):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+            if encoding is not None:
+                responder = _CompressionResponder(self.app, encoding, self.minimum_size)
+                await responder(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+class _CompressionResponder:
+    """单个响应的压缩状态"""
+
+    def __init__(self, app: ASGIApp, encoding: str, minimum_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.codec = CODECS[encoding]
+        self.minimum_size = minimum_size
+        self.send: Send
+        self.initial_message: Message = {}
+        self.started = False
+        self.passthrough = False
+        self.stream: Any = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.send_with_compression)
+
+    def _set_encoding_headers(self) -> MutableHeaders:
+        headers = MutableHeaders(raw=self.initial_message["headers"])
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        return headers
+
+    async def send_with_compression(self, message: Message) -> None:
+        message_type = message["type"]
+
+        if message_type == "http.response.start":
+            self.initial_message = message
+            headers = Headers(raw=message["headers"])
+            # 已编码的响应和SSE事件流原样转发
+            self.passthrough = (
+                "content-encoding" in headers
+                or headers.get("content-type", "").startswith("text/event-stream")
+            )
+            return
+
+        if message_type != "http.response.body":
+            await self.send(message)
+            return
+
+        if self.passthrough:
+            if not self.started:
+                self.started = True
+                await self.send(self.initial_message)
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if not self.started:
+            self.started = True
+
+            if len(body) < self.minimum_size and not more_body:
+                # 响应体过小，不压缩
+                await self.send(self.initial_message)
+                await self.send(message)
+                return
+
+            if not more_body:
+                # 完整响应体一次性压缩
+                if len(body) >= COMPRESS_IN_THREAD_THRESHOLD:
+                    body = await asyncio.to_thread(self.codec.compress, body)
+                else:
+                    body = self.codec.compress(body)
+                headers = self._set_encoding_headers()
+                headers["Content-Length"] = str(len(body))
+                message["body"] = body
+                await self.send(self.initial_message)
+                await self.send(message)
+                return
+
+            # 流式响应使用增量压缩器，长度未知
+            headers = self._set_encoding_headers()
+            del headers["Content-Length"]
+            self.stream = self.codec.stream()
+            message["body"] = self.stream.compress(body)
+            await self.send(self.initial_message)
+            await self.send(message)
+            return
+
+        chunk = self.stream.compress(body)
+        if not more_body:
+            chunk += self.stream.flush()
+        message["body"] = chunk
+        await self.send(message)
@@ -3,9 +3,12 @@
 使用Pydantic Settings管理环境变量和配置
 """
 
-from typing import List, Optional
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, List, Mapping, Optional
+from urllib.parse import urlparse
 from pydantic import Field
-from pydantic_settings import BaseSettings
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
 class Settings(BaseSettings):
@@ -19,6 +22,10 @@ class Settings(BaseSettings):
     # 服务器配置
     HOST: str = Field(default="0.0.0.0", description="服务器地址")
     PORT: int = Field(default=8000, description="服务器端口")
+    WORKERS: int = Field(
+        default=1,
+        description="服务进程数，Agent与任务状态在进程内存中，多进程需配合外部状态存储"
+    )
     
     # 数据库配置
     DATABASE_URL: str = Field(
@@ -59,6 +66,7 @@ class Settings(BaseSettings):
     
     # 第三方服务API密钥
     AFTERSHIP_API_KEY: Optional[str] = Field(default=None, description="AfterShip API密钥")
+    AFTERSHIP_WEBHOOK_SECRET: Optional[str] = Field(default=None, description="AfterShip Webhook签名密钥")
     SHIPSTATION_API_KEY: Optional[str] = Field(default=None, description="ShipStation API密钥")
     FEDEX_API_KEY: Optional[str] = Field(default=None, description="FedEx API密钥")
     UPS_API_KEY: Optional[str] = Field(default=None, description="UPS API密钥")
@@ -106,11 +114,16 @@ class Settings(BaseSettings):
     # 缓存配置
     CACHE_TTL: int = Field(default=3600, description="缓存TTL(秒)")
     CACHE_MAX_SIZE: int = Field(default=1000, description="缓存最大大小")
+    TRACKING_CACHE_MAX: int = Field(default=100_000, description="物流跟踪缓存最大条目数")
+    TRACKING_CACHE_TTL: int = Field(default=3600, description="物流跟踪缓存TTL(秒)，状态变化由Webhook主动刷新")
+    AFTERSHIP_BULK_SIZE: int = Field(default=100, description="AfterShip批量查询每次请求的跟踪号数")
     
     # Agent配置
     MAX_CONCURRENT_AGENTS: int = Field(default=10, description="最大并发Agent数")
     AGENT_TIMEOUT_SECONDS: int = Field(default=300, description="Agent超时时间(秒)")
     MEMORY_RETENTION_DAYS: int = Field(default=30, description="记忆保留天数")
+    LOGISTICS_MAX_CONCURRENCY: int = Field(default=32, description="物流批量跟踪最大并发承运商请求数")
+    EMAIL_LLM_MAX_CONCURRENCY: int = Field(default=8, description="邮件营销Agent最大并发LLM请求数")
     
     # 速率限制
     RATE_LIMIT_REQUESTS_PER_MINUTE: int = Field(
@@ -130,14 +143,39 @@ class Settings(BaseSettings):
         description="允许的文件类型"
     )
     
-    class Config:
-        env_file = ".env"
-        env_file_encoding = "utf-8"
-        case_sensitive = True
+    # 环境变量与.env在实例化时各读取一次，字段解析只做字典查找
+    # 设置在启动后只读，冻结后禁止运行期修改
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        env_file_encoding="utf-8",
+        case_sensitive=True,
+        frozen=True,
+        extra="ignore",
+    )
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """获取应用设置，进程内只解析一次环境变量和.env"""
+    return Settings()
 
 
 # 创建全局设置实例
-settings = Settings()
+settings = get_settings()
+
+# 数据库连接地址在运行期不变，导入时取一次
+POSTGRES_URL = settings.DATABASE_URL
+REDIS_URL = settings.REDIS_URL
+MONGODB_URL = settings.MONGODB_URL
+CHROMADB_URL = settings.CHROMADB_URL
+
+# 连接地址只解析一次，兼容https、路径和IPv6主机
+_MONGODB = urlparse(MONGODB_URL)
+MONGODB_DB_NAME = _MONGODB.path.lstrip("/")
+_CHROMA = urlparse(CHROMADB_URL)
+CHROMADB_SSL = _CHROMA.scheme == "https"
+CHROMADB_HOST = _CHROMA.hostname or "localhost"
+CHROMADB_PORT = _CHROMA.port or (443 if CHROMADB_SSL else 8000)
 
 
 # 数据库配置类
@@ -147,50 +185,73 @@ class DatabaseConfig:
     @staticmethod
     def get_postgres_url() -> str:
         """获取PostgreSQL连接URL"""
-        return settings.DATABASE_URL
+        return POSTGRES_URL
     
     @staticmethod
     def get_redis_url() -> str:
         """获取Redis连接URL"""
-        return settings.REDIS_URL
+        return REDIS_URL
     
     @staticmethod
     def get_mongodb_url() -> str:
         """获取MongoDB连接URL"""
-        return settings.MONGODB_URL
+        return MONGODB_URL
     
     @staticmethod
     def get_chromadb_url() -> str:
         """获取ChromaDB连接URL"""
-        return settings.CHROMADB_URL
+        return CHROMADB_URL
+    
+    @staticmethod
+    def get_mongodb_db_name() -> str:
+        """获取MongoDB数据库名"""
+        return MONGODB_DB_NAME
+    
+    @staticmethod
+    def get_chromadb_host() -> str:
+        """获取ChromaDB主机名"""
+        return CHROMADB_HOST
+    
+    @staticmethod
+    def get_chromadb_port() -> int:
+        """获取ChromaDB端口"""
+        return CHROMADB_PORT
+    
+    @staticmethod
+    def get_chromadb_ssl() -> bool:
+        """ChromaDB是否使用https"""
+        return CHROMADB_SSL
 
 
 # AI模型配置类
 class AIConfig:
-    """AI模型配置"""
+    """AI模型配置 - 设置在运行期不变，各配置只构造一次并以只读映射共享"""
     
     @staticmethod
-    def get_openai_config() -> dict:
+    @lru_cache(maxsize=1)
+    def get_openai_config() -> Mapping[str, Any]:
         """获取OpenAI配置"""
-        return {
+        return MappingProxyType({
             "api_key": settings.OPENAI_API_KEY,
             "api_base": settings.OPENAI_API_BASE,
             "model": settings.DEFAULT_LLM_MODEL,
             "embedding_model": settings.DEFAULT_EMBEDDING_MODEL
-        }
+        })
     
     @staticmethod
-    def get_anthropic_config() -> dict:
+    @lru_cache(maxsize=1)
+    def get_anthropic_config() -> Mapping[str, Any]:
         """获取Anthropic配置"""
-        return {
+        return MappingProxyType({
             "api_key": settings.ANTHROPIC_API_KEY,
             "model": "claude-3-sonnet-20240229"
-        }
+        })
     
     @staticmethod
-    def get_ollama_config() -> dict:
+    @lru_cache(maxsize=1)
+    def get_ollama_config() -> Mapping[str, Any]:
         """获取Ollama配置"""
-        return {
+        return MappingProxyType({
             "base_url": settings.OLLAMA_BASE_URL,
             "model": "llama2:7b"
-        }
+        })
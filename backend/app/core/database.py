@@ -12,16 +12,52 @@ from sqlalchemy.ext.asyncio import (
     AsyncSession,
     async_sessionmaker
 )
-from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy import event, text
+from sqlalchemy.orm import DeclarativeBase, ORMExecuteState, Session
+import httpx
 import redis.asyncio as redis
 from motor.motor_asyncio import AsyncIOMotorClient
 import chromadb
 from chromadb.config import Settings as ChromaSettings
 
-from app.core.config import settings, DatabaseConfig
+from app.core.config import settings, DatabaseConfig, CHROMADB_URL
 from app.utils.logger import logger
 
 
+# 连接探活语句，不开启事务
+PING_QUERY = text("SELECT 1")
+
+# ChromaDB心跳接口
+CHROMADB_HEARTBEAT_PATH = "/api/v1/heartbeat"
+
+
+# 会话info中的写入标记，会话结束时据此决定提交还是回滚
+SESSION_WRITES_KEY = "has_writes"
+
+
+@event.listens_for(Session, "before_flush")
+def _mark_flush(session: Session, flush_context, instances) -> None:
+    """ORM对象变更刷新到数据库时标记写入"""
+    session.info[SESSION_WRITES_KEY] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_write_statement(orm_execute_state: ORMExecuteState) -> None:
+    """通过execute执行的非SELECT语句(含text)视为写入"""
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info[SESSION_WRITES_KEY] = True
+
+
+def session_has_writes(session: Session) -> bool:
+    """会话是否有已执行或待刷新的写入"""
+    return bool(
+        session.info.get(SESSION_WRITES_KEY)
+        or session.new
+        or session.dirty
+        or session.deleted
+    )
+
+
 class Base(DeclarativeBase):
     """SQLAlchemy基础模型类"""
     pass
@@ -37,6 +73,7 @@ class DatabaseManager:
         self.mongodb_client = None
         self.mongodb_db = None
         self.chroma_client = None
+        self.chroma_http = None
         
     async def init_postgres(self):
         """初始化PostgreSQL连接"""
@@ -57,8 +94,8 @@ class DatabaseManager:
             )
             
             # 测试连接
-            async with self.postgres_engine.begin() as conn:
-                await conn.run_sync(lambda _: None)
+            async with self.postgres_engine.connect() as conn:
+                await conn.execute(PING_QUERY)
                 
             logger.info("✅ PostgreSQL连接已建立")
             
@@ -69,11 +106,15 @@ class DatabaseManager:
     async def init_redis(self):
         """初始化Redis连接"""
         try:
+            # from_url按这些参数创建连接池，并在close()时一并释放
             self.redis_client = redis.from_url(
                 DatabaseConfig.get_redis_url(),
                 encoding="utf-8",
                 decode_responses=True,
-                max_connections=20
+                max_connections=50,
+                health_check_interval=30,  # 空闲超过30秒的连接先探活，避免用到失效连接
+                socket_keepalive=True,
+                protocol=3  # RESP3
             )
             
             # 测试连接
@@ -95,8 +136,7 @@ class DatabaseManager:
             )
             
             # 获取数据库
-            db_name = DatabaseConfig.get_mongodb_url().split("/")[-1]
-            self.mongodb_db = self.mongodb_client[db_name]
+            self.mongodb_db = self.mongodb_client[DatabaseConfig.get_mongodb_db_name()]
             
             # 测试连接
             await self.mongodb_client.admin.command('ping')
@@ -110,8 +150,9 @@ class DatabaseManager:
         """初始化ChromaDB连接"""
         try:
             self.chroma_client = chromadb.HttpClient(
-                host=DatabaseConfig.get_chromadb_url().replace("http://", "").split(":")[0],
-                port=int(DatabaseConfig.get_chromadb_url().split(":")[-1]),
+                host=DatabaseConfig.get_chromadb_host(),
+                port=str(DatabaseConfig.get_chromadb_port()),
+                ssl=DatabaseConfig.get_chromadb_ssl(),
                 settings=ChromaSettings(
                     anonymized_telemetry=False,
                     allow_reset=True
@@ -120,6 +161,12 @@ class DatabaseManager:
             
             # 测试连接
             self.chroma_client.heartbeat()
+            
+            # 运行期心跳走共享的异步连接池，不占用工作线程
+            self.chroma_http = httpx.AsyncClient(
+                base_url=CHROMADB_URL,
+                timeout=httpx.Timeout(5.0)
+            )
             logger.info("✅ ChromaDB连接已建立")
             
         except Exception as e:
@@ -139,6 +186,9 @@ class DatabaseManager:
         if self.mongodb_client:
             self.mongodb_client.close()
             
+        if self.chroma_http:
+            tasks.append(self.chroma_http.aclose())
+            
         if tasks:
             await asyncio.gather(*tasks, return_exceptions=True)
             
@@ -152,10 +202,18 @@ db_manager = DatabaseManager()
 async def init_db():
     """初始化所有数据库连接"""
     try:
-        await db_manager.init_postgres()
-        await db_manager.init_redis()
-        await db_manager.init_mongodb()
-        db_manager.init_chromadb()
+        # 并发建立连接，ChromaDB客户端为同步实现，放到工作线程执行
+        results = await asyncio.gather(
+            db_manager.init_postgres(),
+            db_manager.init_redis(),
+            db_manager.init_mongodb(),
+            asyncio.to_thread(db_manager.init_chromadb),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        
         logger.info("🎉 所有数据库连接初始化完成")
         
     except Exception as e:
@@ -178,7 +236,12 @@ async def get_postgres_session() -> AsyncGenerator[AsyncSession, None]:
     async with db_manager.postgres_session_maker() as session:
         try:
             yield session
-            await session.commit()
+            # SQLAlchemy执行任何语句都会自动开启事务，只读会话回滚即可，不产生提交
+            if session.in_transaction():
+                if session_has_writes(session.sync_session):
+                    await session.commit()
+                else:
+                    await session.rollback()
         except Exception:
             await session.rollback()
             raise
@@ -211,46 +274,58 @@ def get_chromadb() -> chromadb.HttpClient:
 
 
 # 数据库健康检查
+async def _check_postgres() -> bool:
+    """检查PostgreSQL连接"""
+    if not db_manager.postgres_engine:
+        return False
+    async with db_manager.postgres_engine.connect() as conn:
+        await conn.execute(PING_QUERY)
+    return True
+
+
+async def _check_redis() -> bool:
+    """检查Redis连接"""
+    if not db_manager.redis_client:
+        return False
+    await db_manager.redis_client.ping()
+    return True
+
+
+async def _check_mongodb() -> bool:
+    """检查MongoDB连接"""
+    if not db_manager.mongodb_client:
+        return False
+    await db_manager.mongodb_client.admin.command('ping')
+    return True
+
+
+async def _check_chromadb() -> bool:
+    """检查ChromaDB连接"""
+    if not db_manager.chroma_http:
+        return False
+    response = await db_manager.chroma_http.get(CHROMADB_HEARTBEAT_PATH)
+    response.raise_for_status()
+    return True
+
+
 async def check_database_health() -> dict:
     """检查所有数据库连接状态"""
-    health_status = {
-        "postgres": False,
-        "redis": False,
-        "mongodb": False,
-        "chromadb": False
-    }
-    
-    # 检查PostgreSQL
-    try:
-        if db_manager.postgres_engine:
-            async with db_manager.postgres_engine.begin() as conn:
-                await conn.run_sync(lambda _: None)
-            health_status["postgres"] = True
-    except Exception as e:
-        logger.warning(f"PostgreSQL健康检查失败: {e}")
+    # 并发探测，总耗时取决于最慢的一项
+    names = ("postgres", "redis", "mongodb", "chromadb")
+    results = await asyncio.gather(
+        _check_postgres(),
+        _check_redis(),
+        _check_mongodb(),
+        _check_chromadb(),
+        return_exceptions=True
+    )
     
-    # 检查Redis
-    try:
-        if db_manager.redis_client:
-            await db_manager.redis_client.ping()
-            health_status["redis"] = True
-    except Exception as e:
-        logger.warning(f"Redis健康检查失败: {e}")
-    
-    # 检查MongoDB
-    try:
-        if db_manager.mongodb_client:
-            await db_manager.mongodb_client.admin.command('ping')
-            health_status["mongodb"] = True
-    except Exception as e:
-        logger.warning(f"MongoDB健康检查失败: {e}")
-    
-    # 检查ChromaDB
-    try:
-        if db_manager.chroma_client:
-            db_manager.chroma_client.heartbeat()
-            health_status["chromadb"] = True
-    except Exception as e:
-        logger.warning(f"ChromaDB健康检查失败: {e}")
+    health_status = {}
+    for name, result in zip(names, results):
+        if isinstance(result, BaseException):
+            logger.warning(f"{name}健康检查失败: {result}")
+            health_status[name] = False
+        else:
+            health_status[name] = result
     
     return health_status
@@ -3,13 +3,20 @@ SaasAgent主应用入口
 FastAPI应用配置和路由注册
 """
 
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, Response
+from fastapi.utils import is_body_allowed_for_status_code
+from prometheus_fastapi_instrumentator import Instrumentator
+from starlette.exceptions import HTTPException as StarletteHTTPException
 import uvicorn
 
+from app.agents.agent_orchestrator import orchestrator
+from app.agents.email_marketing_agent import EmailMarketingAgent
+from app.agents.logistics_agent import LogisticsAgent
+from app.core.compression import CompressionMiddleware
 from app.core.config import settings
 from app.core.database import init_db, close_db
 from app.api.routes import api_router
@@ -20,10 +27,18 @@ from app.utils.logger import logger
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
     # 启动时初始化
-    logger.info("🚀 SaasAgent应用启动中...")
+    logger.info(
+        "🚀 SaasAgent应用启动中...",
+        event_loop=type(asyncio.get_running_loop()).__module__
+    )
     await init_db()
     logger.info("✅ 数据库连接已建立")
     
+    # 注册Agent类型
+    orchestrator.register_agent_type("logistics", LogisticsAgent)
+    orchestrator.register_agent_type("email_marketing", EmailMarketingAgent)
+    logger.info("✅ Agent类型注册完成")
+    
     yield
     
     # 关闭时清理
@@ -40,26 +55,59 @@ app = FastAPI(
     docs_url="/docs" if settings.DEBUG else None,
     redoc_url="/redoc" if settings.DEBUG else None,
     openapi_url="/openapi.json" if settings.DEBUG else None,
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
+# 前端实际发送的请求头
+CORS_ALLOW_HEADERS = ["authorization", "content-type", "x-requested-with"]
+
 # 添加中间件
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=settings.CORS_ORIGINS,
+    # CORSMiddleware以`in`判断来源，传入frozenset即为O(1)查找
+    allow_origins=frozenset(settings.CORS_ORIGINS),
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-    allow_headers=["*"],
+    allow_headers=CORS_ALLOW_HEADERS,
 )
 
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+app.add_middleware(CompressionMiddleware, minimum_size=1000)
+
+# Prometheus指标，固定的小桶集合，状态码按2xx/4xx分组，存活探针与抓取端点不计入
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+if settings.PROMETHEUS_ENABLED:
+    Instrumentator(
+        should_group_status_codes=True,
+        should_ignore_untemplated=True,
+        excluded_handlers=["^/health$", "^/api/v1/health$", "^/metrics$"],
+    ).instrument(
+        app,
+        latency_highr_buckets=METRICS_LATENCY_BUCKETS,
+        latency_lowr_buckets=(0.1, 0.5, 1),
+    ).expose(app, include_in_schema=False)
+
+
+# HTTP异常处理器，替换FastAPI默认基于JSONResponse的实现
+@app.exception_handler(StarletteHTTPException)
+async def http_exception_handler(request, exc):
+    headers = getattr(exc, "headers", None)
+    # 1xx/204/304状态码和HEAD请求不能携带响应体
+    if request.method == "HEAD" or not is_body_allowed_for_status_code(exc.status_code):
+        return Response(status_code=exc.status_code, headers=headers)
+    return ORJSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+        headers=headers
+    )
 
 
 # 全局异常处理器
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     logger.error(f"全局异常: {exc}", exc_info=True)
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={
             "error": "内部服务器错误",
@@ -102,5 +150,8 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=8000,
         reload=settings.DEBUG,
+        workers=None if settings.DEBUG else settings.WORKERS,
+        loop="uvloop",
+        http="httptools",
         log_level="info"
     )
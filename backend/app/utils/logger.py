@@ -6,27 +6,34 @@
 import sys
 import logging
 from typing import Any, Dict
+import orjson
 import structlog
 from structlog.stdlib import LoggerFactory
 
 from app.core.config import settings
 
 
+def _orjson_dumps(obj: Any, **kwargs: Any) -> str:
+    """orjson序列化日志事件，标准库logging需要str"""
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS, **kwargs).decode()
+
+
 def configure_logging():
     """配置日志系统"""
     
+    log_level = getattr(logging, settings.LOG_LEVEL.upper())
+    
     # 配置标准库日志
     logging.basicConfig(
         format="%(message)s",
         stream=sys.stdout,
-        level=getattr(logging, settings.LOG_LEVEL.upper())
+        level=log_level
     )
     
     # 配置structlog
     structlog.configure(
         processors=[
-            # 添加时间戳
-            structlog.stdlib.filter_by_level,
+            # 级别过滤由wrapper_class完成，此处不再逐条调用filter_by_level
             structlog.stdlib.add_logger_name,
             structlog.stdlib.add_log_level,
             structlog.stdlib.PositionalArgumentsFormatter(),
@@ -36,11 +43,12 @@ def configure_logging():
             structlog.processors.UnicodeDecoder(),
             # 在开发环境使用彩色输出
             structlog.dev.ConsoleRenderer() if settings.DEBUG 
-            else structlog.processors.JSONRenderer()
+            else structlog.processors.JSONRenderer(serializer=_orjson_dumps)
         ],
         context_class=dict,
         logger_factory=LoggerFactory(),
-        wrapper_class=structlog.stdlib.BoundLogger,
+        # 低于LOG_LEVEL的调用直接为空操作，不构造事件字典也不走处理器链
+        wrapper_class=structlog.make_filtering_bound_logger(log_level),
         cache_logger_on_first_use=True,
     )
 
@@ -52,65 +60,75 @@ configure_logging()
 logger = structlog.get_logger("saasagent")
 
 
+# 按类缓存的绑定logger，class_name只取决于类型
+_class_loggers: Dict[type, Any] = {}
+
+
 class LoggerMixin:
     """日志混入类，为其他类提供日志功能"""
     
     @property
     def logger(self):
-        """获取带有类名上下文的logger"""
-        return logger.bind(class_name=self.__class__.__name__)
+        """获取带有类名上下文的logger，每个类只绑定一次，也适用于__slots__类"""
+        cls = type(self)
+        bound = _class_loggers.get(cls)
+        if bound is None:
+            bound = _class_loggers[cls] = logger.bind(class_name=cls.__name__)
+        return bound
 
 
 def log_function_call(func_name: str, args: Dict[str, Any] = None, 
                      result: Any = None, error: Exception = None):
     """记录函数调用日志"""
-    log_data = {"function": func_name}
-    
+    extra: Dict[str, Any] = {}
     if args:
-        log_data["args"] = args
-        
+        extra["args"] = args
+    
     if error:
-        logger.error("函数调用失败", **log_data, error=str(error))
+        log, message = logger.error, "函数调用失败"
+        extra["error"] = str(error)
     else:
+        log, message = logger.info, "函数调用成功"
         if result is not None:
-            log_data["result_type"] = type(result).__name__
-        logger.info("函数调用成功", **log_data)
+            extra["result_type"] = type(result).__name__
+    
+    log(message, function=func_name, **extra)
+
+# 按Agent名缓存的绑定logger
+_agent_loggers: Dict[str, Any] = {}
+
+
+def _agent_logger(agent_name: str):
+    """获取绑定了agent字段的logger"""
+    bound = _agent_loggers.get(agent_name)
+    if bound is None:
+        bound = _agent_loggers[agent_name] = logger.bind(agent=agent_name)
+    return bound
 
 
 def log_agent_activity(agent_name: str, action: str, status: str, 
                       details: Dict[str, Any] = None):
     """记录Agent活动日志"""
-    log_data = {
-        "agent": agent_name,
-        "action": action,
-        "status": status
-    }
-    
-    if details:
-        log_data.update(details)
+    agent_logger = _agent_logger(agent_name)
+    # details与固定字段同名时以details为准，与合并前的行为一致
+    log_data = {"action": action, "status": status, **(details or {})}
         
     if status == "success":
-        logger.info("Agent活动完成", **log_data)
+        agent_logger.info("Agent活动完成", **log_data)
     elif status == "error":
-        logger.error("Agent活动失败", **log_data)
+        agent_logger.error("Agent活动失败", **log_data)
     else:
-        logger.info("Agent活动进行中", **log_data)
+        agent_logger.info("Agent活动进行中", **log_data)
 
 
 def log_api_request(method: str, path: str, status_code: int, 
                    duration: float, user_id: str = None):
     """记录API请求日志"""
-    log_data = {
-        "method": method,
-        "path": path,
-        "status_code": status_code,
-        "duration_ms": round(duration * 1000, 2)
-    }
-    
-    if user_id:
-        log_data["user_id"] = user_id
-        
     if status_code >= 400:
-        logger.warning("API请求异常", **log_data)
+        log, message = logger.warning, "API请求异常"
     else:
-        logger.info("API请求完成", **log_data)
+        log, message = logger.info, "API请求完成"
+    
+    extra: Dict[str, Any] = {"user_id": user_id} if user_id else {}
+    log(message, method=method, path=path, status_code=status_code,
+        duration_ms=round(duration * 1000, 2), **extra)
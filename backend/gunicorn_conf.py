@@ -0,0 +1,23 @@
+"""
+Gunicorn多进程部署配置
+启动: gunicorn app.main:app -c gunicorn_conf.py
+"""
+
+from app.core.config import settings
+
+# 在主进程中导入应用，设置解析、URL解析等模块级结果经写时复制由各worker共享
+preload_app = True
+
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = settings.WORKERS
+bind = f"{settings.HOST}:{settings.PORT}"
+loglevel = settings.LOG_LEVEL.lower()
+
+
+def post_fork(server, worker):
+    """fork后的worker钩子
+
+    数据库连接不能跨进程共享，也不能在此用asyncio.run建立(事件循环随即关闭)，
+    连接由应用lifespan在worker自己的事件循环中创建
+    """
+    server.log.info("Worker %s 已启动，数据库连接将在lifespan中建立", worker.pid)
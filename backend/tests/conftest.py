@@ -0,0 +1,53 @@
+"""
+测试公共夹具
+"""
+
+from typing import Any, Dict
+
+import pytest
+
+from app.agents.agent_orchestrator import AgentOrchestrator, WorkflowStep
+from app.agents.base_agent import AgentTask, BaseAgent
+
+
+class EchoAgent(BaseAgent):
+    """测试用Agent：返回输入值加一，可配置前若干次调用失败"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = 0
+        self.fail_times = self.config.get("fail_times", 0)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def cleanup(self) -> None:
+        pass
+
+    async def process_task(self, task: AgentTask) -> Dict[str, Any]:
+        if not self.is_running:
+            raise RuntimeError(f"Agent已停止: {self.agent_id}")
+        self.calls += 1
+        if self.calls <= self.fail_times:
+            raise RuntimeError("模拟失败")
+        return {"value": task.payload.get("x", 0) + 1}
+
+
+def echo_step(step_id: str, source: str, target: str, **kwargs: Any) -> WorkflowStep:
+    """构造读取source、写入target的步骤"""
+    return WorkflowStep(
+        id=step_id,
+        name=step_id,
+        agent_type="echo",
+        input_mapping={"x": source},
+        output_mapping={"value": target},
+        **kwargs
+    )
+
+
+@pytest.fixture
+async def orchestrator():
+    orchestrator = AgentOrchestrator()
+    orchestrator.register_agent_type("echo", EchoAgent)
+    yield orchestrator
+    await orchestrator.shutdown()
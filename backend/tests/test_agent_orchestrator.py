@@ -0,0 +1,150 @@
+"""
+Agent编排器测试
+"""
+
+import asyncio
+from datetime import datetime
+
+import orjson
+import pytest
+
+from app.agents.agent_orchestrator import AgentOrchestrator, WorkflowStatus
+from conftest import EchoAgent, echo_step
+
+
+async def test_workflow_runs_all_steps_end_to_end(orchestrator):
+    steps = [echo_step("s1", "x", "y"), echo_step("s2", "y", "z")]
+    await orchestrator.create_workflow("w1", "wf", steps, {"s1": ["s2"]})
+
+    state = await orchestrator.execute_workflow("w1", {"x": 1})
+
+    assert state["status"] == WorkflowStatus.COMPLETED
+    assert state["completed_steps"] == ["s1", "s2"]
+    assert state["failed_steps"] == []
+    assert state["error"] is None
+    assert state["context"]["z"] == 3
+
+
+async def test_removing_agent_recompiles_workflow_on_next_run(orchestrator):
+    steps = [echo_step("s1", "x", "y", max_retries=0)]
+    await orchestrator.create_workflow("w1", "wf", steps, {})
+    stale_graph = orchestrator.workflows["w1"]
+    removed = orchestrator.agents["echo_s1"]
+    await orchestrator.remove_agent("echo_s1")
+
+    assert "w1" not in orchestrator.workflows
+
+    state = await orchestrator.execute_workflow("w1", {"x": 1})
+
+    assert state["status"] == WorkflowStatus.COMPLETED
+    assert state["context"]["y"] == 2
+    assert orchestrator.workflows["w1"] is not stale_graph
+    assert orchestrator.agents["echo_s1"] is not removed
+    assert removed.calls == 0
+
+
+async def test_same_shape_workflows_share_graph_until_agent_removed(orchestrator):
+    steps = [echo_step("s1", "x", "y")]
+    await orchestrator.create_workflow("w1", "wf", steps, {})
+    await orchestrator.create_workflow("w2", "wf", steps, {})
+    assert orchestrator.workflows["w2"] is orchestrator.workflows["w1"]
+
+    await orchestrator.remove_agent("echo_s1")
+    await orchestrator.create_workflow("w3", "wf", steps, {})
+
+    assert orchestrator.agents["echo_s1"].is_running
+    assert "w1" not in orchestrator.workflows
+    assert "w2" not in orchestrator.workflows
+
+
+async def test_cacheable_step_reuses_result_for_same_input(orchestrator):
+    steps = [echo_step("s1", "x", "y", cacheable=True)]
+    await orchestrator.create_workflow("w1", "wf", steps, {})
+
+    first = await orchestrator.execute_workflow("w1", {"x": 1})
+    second = await orchestrator.execute_workflow("w1", {"x": 1})
+
+    assert first["context"]["y"] == second["context"]["y"] == 2
+    assert orchestrator.agents["echo_s1"].calls == 1
+
+
+def test_step_cache_key_ignores_input_key_order():
+    step = echo_step("s1", "x", "y")
+    assert AgentOrchestrator._step_cache_key(step, {"a": 1, "b": 2}) == \
+        AgentOrchestrator._step_cache_key(step, {"b": 2, "a": 1})
+
+
+async def test_failed_step_is_retried_through_graph_edge(orchestrator):
+    await orchestrator.create_agent("echo_s1", "echo", "s1", [], {"fail_times": 1})
+    steps = [echo_step("s1", "x", "y", max_retries=1), echo_step("s2", "y", "z")]
+    await orchestrator.create_workflow("w1", "wf", steps, {"s1": ["s2"]})
+
+    state = await orchestrator.execute_workflow("w1", {"x": 1})
+
+    assert state["retry_counts"] == {"s1": 1}
+    assert state["completed_steps"] == ["s1", "s2"]
+    assert state["context"]["z"] == 3
+    assert orchestrator.agents["echo_s1"].calls == 2
+
+
+async def test_step_fails_workflow_after_retries_exhausted(orchestrator):
+    await orchestrator.create_agent("echo_s1", "echo", "s1", [], {"fail_times": 1})
+    steps = [echo_step("s1", "x", "y", max_retries=0), echo_step("s2", "y", "z")]
+    await orchestrator.create_workflow("w1", "wf", steps, {"s1": ["s2"]})
+
+    state = await orchestrator.execute_workflow("w1", {"x": 1})
+
+    assert state["status"] == WorkflowStatus.FAILED
+    assert state["failed_steps"] == ["s1"]
+    assert state["completed_steps"] == []
+    assert state["error"] == "模拟失败"
+    assert orchestrator.agents["echo_s2"].calls == 0
+
+    summary = orjson.loads(await orchestrator.get_workflow_summary())
+    assert summary["workflow_details"][0]["status"] == "failed"
+
+
+async def test_multiple_successors_are_rejected(orchestrator):
+    steps = [echo_step("s1", "x", "y"), echo_step("s2", "y", "z"), echo_step("s3", "y", "w")]
+
+    with pytest.raises(ValueError):
+        await orchestrator.create_workflow("w1", "wf", steps, {"s1": ["s2", "s3"]})
+
+
+async def test_summaries_serialize_to_json_bytes(orchestrator):
+    await orchestrator.create_workflow("w1", "wf", [echo_step("s1", "x", "y")], {})
+    await orchestrator.execute_workflow("w1", {"x": 1})
+
+    agent_summary = await orchestrator.get_agent_status_summary()
+    workflow_summary = await orchestrator.get_workflow_summary()
+
+    assert isinstance(agent_summary, bytes)
+    assert isinstance(workflow_summary, bytes)
+
+    agents = orjson.loads(agent_summary)
+    assert agents["total_agents"] == 1
+    assert agents["running_agents"] == 1
+    assert agents["agent_details"][0]["agent_id"] == "echo_s1"
+
+    workflows = orjson.loads(workflow_summary)
+    detail = workflows["workflow_details"][0]
+    assert workflows["total_workflows"] == 1
+    assert detail["status"] == "completed"
+    assert detail["completed_steps"] == 1
+    # datetime由orjson序列化为ISO 8601字符串
+    assert datetime.fromisoformat(detail["completed_at"])
+
+
+async def test_workflow_runs_wait_for_workflow_slot():
+    orchestrator = AgentOrchestrator(max_concurrent_workflows=1)
+    orchestrator.register_agent_type("echo", EchoAgent)
+    await orchestrator.create_workflow("w1", "wf", [echo_step("s1", "x", "y")], {})
+
+    async with orchestrator._workflow_sem:
+        run = asyncio.create_task(orchestrator.execute_workflow("w1", {"x": 1}))
+        await asyncio.sleep(0.05)
+        assert orchestrator.agents["echo_s1"].calls == 0
+
+    state = await run
+    assert state["status"] == WorkflowStatus.COMPLETED
+    await orchestrator.shutdown()
@@ -0,0 +1,123 @@
+"""
+响应压缩中间件测试
+"""
+
+import gzip
+
+import brotli
+import pytest
+import zstandard
+
+from app.core.compression import (
+    COMPRESS_IN_THREAD_THRESHOLD,
+    CompressionMiddleware,
+    negotiate_encoding,
+)
+
+BODY = b'{"data": "' + b"x" * 5000 + b'"}'
+
+
+def _app(chunks, content_type=b"application/json", extra_headers=()):
+    async def app(scope, receive, send):
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", content_type), *extra_headers]
+        })
+        for index, chunk in enumerate(chunks):
+            await send({
+                "type": "http.response.body",
+                "body": chunk,
+                "more_body": index < len(chunks) - 1
+            })
+    return app
+
+
+async def _call(app, accept_encoding):
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(b"accept-encoding", accept_encoding.encode())]
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await CompressionMiddleware(app, minimum_size=1000)(scope, receive, send)
+    headers = {key.decode(): value.decode() for key, value in messages[0]["headers"]}
+    body = b"".join(message.get("body", b"") for message in messages[1:])
+    return headers, body
+
+
+DECODERS = {
+    "zstd": lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(data),
+    "br": brotli.decompress,
+    "gzip": gzip.decompress,
+}
+
+
+@pytest.mark.parametrize("accept, expected", [
+    ("gzip, deflate, br, zstd", "zstd"),
+    ("gzip, br", "br"),
+    ("gzip", "gzip"),
+    ("zstd;q=0, gzip", "gzip"),
+    ("identity", None),
+    ("", None),
+])
+def test_negotiate_encoding_prefers_zstd_then_br_then_gzip(accept, expected):
+    assert negotiate_encoding(accept) == expected
+
+
+@pytest.mark.parametrize("encoding", ["zstd", "br", "gzip"])
+async def test_complete_body_is_compressed(encoding):
+    headers, body = await _call(_app([BODY]), encoding)
+
+    assert headers["content-encoding"] == encoding
+    assert headers["content-length"] == str(len(body))
+    assert "Accept-Encoding" in headers["vary"]
+    assert DECODERS[encoding](body) == BODY
+
+
+@pytest.mark.parametrize("encoding", ["zstd", "br", "gzip"])
+async def test_streamed_body_is_compressed_incrementally(encoding):
+    chunks = [BODY[:2000], BODY[2000:4000], BODY[4000:]]
+    headers, body = await _call(_app(chunks), encoding)
+
+    assert headers["content-encoding"] == encoding
+    assert "content-length" not in headers
+    assert DECODERS[encoding](body) == BODY
+
+
+async def test_small_body_is_left_uncompressed():
+    headers, body = await _call(_app([b'{"ok": true}']), "zstd")
+
+    assert "content-encoding" not in headers
+    assert body == b'{"ok": true}'
+
+
+async def test_event_stream_passes_through():
+    chunks = [b"data: " + b"x" * 2000 + b"\n\n", b"data: end\n\n"]
+    headers, body = await _call(_app(chunks, content_type=b"text/event-stream"), "gzip")
+
+    assert "content-encoding" not in headers
+    assert body == b"".join(chunks)
+
+
+async def test_already_encoded_response_passes_through():
+    headers, body = await _call(_app([BODY], extra_headers=[(b"content-encoding", b"identity")]), "gzip")
+
+    assert headers["content-encoding"] == "identity"
+    assert body == BODY
+
+
+async def test_large_body_is_compressed_off_the_event_loop():
+    large = b"y" * (COMPRESS_IN_THREAD_THRESHOLD + 1)
+    headers, body = await _call(_app([large]), "zstd")
+
+    assert headers["content-encoding"] == "zstd"
+    assert DECODERS["zstd"](body) == large
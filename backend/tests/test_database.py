@@ -0,0 +1,24 @@
+"""
+数据库会话测试
+"""
+
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import Session
+
+from app.core.database import session_has_writes
+
+
+def test_select_only_session_has_no_writes():
+    with Session(create_engine("sqlite://")) as session:
+        session.execute(select(1))
+
+        assert session.in_transaction()
+        assert not session_has_writes(session)
+
+
+def test_write_statement_marks_session():
+    with Session(create_engine("sqlite://")) as session:
+        session.execute(text("CREATE TABLE t (x INTEGER)"))
+        session.execute(text("INSERT INTO t VALUES (1)"))
+
+        assert session_has_writes(session)
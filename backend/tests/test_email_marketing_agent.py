@@ -0,0 +1,50 @@
+"""
+邮件营销Agent测试
+"""
+
+from langchain_core.messages import AIMessage
+
+from app.agents.email_marketing_agent import CampaignType, EmailCampaign, EmailMarketingAgent
+from app.core.config import settings
+
+
+def test_llm_semaphore_is_per_instance_and_sized_by_setting():
+    first = EmailMarketingAgent("email_1", "邮件1")
+    second = EmailMarketingAgent("email_2", "邮件2")
+
+    assert first._llm_semaphore is not second._llm_semaphore
+    assert first._llm_semaphore._value == settings.EMAIL_LLM_MAX_CONCURRENCY
+
+
+async def test_ai_prompt_only_contains_fields_covered_by_cache_key():
+    agent = EmailMarketingAgent("email_1", "邮件1")
+    template = agent.default_templates["welcome"]
+    campaign = EmailCampaign(
+        campaign_id="c1",
+        name="欢迎",
+        campaign_type=CampaignType.WELCOME,
+        target_audience={},
+        template_id=template.template_id,
+        schedule={}
+    )
+    alice = {"customer_name": "张三", "brand_name": "品牌", "shop_url": "https://shop", "vip_level": "gold"}
+    bob = {**alice, "vip_level": "none", "email": "bob@example.com"}
+
+    # 只有模板变量进入提示词，因此相同变量值的客户可以共享缓存内容
+    assert agent._ai_cache_key(campaign, template, alice) == agent._ai_cache_key(campaign, template, bob)
+
+    sent = []
+
+    class FakeLLM:
+        async def ainvoke(self, messages):
+            sent.append(messages)
+            return AIMessage(content="主题：欢迎\n内容：你好")
+
+    agent.llm = FakeLLM()
+    content = await agent._request_ai_content(campaign, template, bob)
+
+    assert content == {"subject": "欢迎", "content": "你好"}
+    prompt_text = "".join(message.content for message in sent[0])
+    assert "张三" in prompt_text
+    assert "vip_level" not in prompt_text
+    assert "bob@example.com" not in prompt_text
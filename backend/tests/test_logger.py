@@ -0,0 +1,51 @@
+"""
+日志工具测试
+"""
+
+from structlog.testing import capture_logs
+
+from app.utils.logger import log_agent_activity, log_api_request, log_function_call
+
+
+def test_log_agent_activity_accepts_details_overlapping_fixed_fields():
+    with capture_logs() as logs:
+        log_agent_activity(
+            "overlap_agent",
+            "sync",
+            "success",
+            details={"status": "partial", "action": "sync_orders", "count": 3}
+        )
+
+    assert len(logs) == 1
+    event = logs[0]
+    assert event["agent"] == "overlap_agent"
+    assert event["action"] == "sync_orders"
+    assert event["status"] == "partial"
+    assert event["count"] == 3
+
+
+def test_log_function_call_logs_error_once_with_args():
+    with capture_logs() as logs:
+        log_function_call("sync", args={"id": 1}, error=ValueError("boom"))
+
+    assert logs == [{
+        "event": "函数调用失败",
+        "log_level": "error",
+        "function": "sync",
+        "args": {"id": 1},
+        "error": "boom"
+    }]
+
+
+def test_log_api_request_omits_missing_user_id():
+    with capture_logs() as logs:
+        log_api_request("GET", "/x", 404, 0.0123)
+
+    assert logs == [{
+        "event": "API请求异常",
+        "log_level": "warning",
+        "method": "GET",
+        "path": "/x",
+        "status_code": 404,
+        "duration_ms": 12.3
+    }]
@@ -0,0 +1,161 @@
+"""
+物流跟踪Agent测试
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.agents import logistics_agent
+from app.agents.logistics_agent import LogisticsAgent, ShipmentStatus, TrackingInfo
+
+
+def test_cached_tracking_round_trips_events_through_compressed_blob():
+    agent = LogisticsAgent("logistics_1", "物流")
+    events = [{"location": f"站点{i}", "message": "运输中"} for i in range(20)]
+    info = TrackingInfo(
+        tracking_number="1Z999",
+        carrier="ups",
+        status=ShipmentStatus.IN_TRANSIT,
+        tracking_events=events
+    )
+
+    data = agent._cache_tracking("ups", info)
+    cached = agent._get_cached_tracking("ups", "1Z999")
+
+    assert cached.info.tracking_events == []
+    assert cached.data == data
+    assert cached.data["tracking_events"] == events
+
+
+def test_parse_datetime_accepts_iso_string_with_z_suffix():
+    parsed = LogisticsAgent("logistics_1", "物流")._parse_datetime("2024-05-01T10:00:00Z")
+
+    assert parsed.year == 2024
+    assert parsed.tzinfo is not None
+
+
+@pytest.mark.parametrize("value", ["not a date", 1714557600, None])
+def test_parse_datetime_returns_none_for_unparseable_values(value):
+    assert LogisticsAgent("logistics_1", "物流")._parse_datetime(value) is None
+
+
+def test_evicted_cache_entries_are_dropped_from_indexes(monkeypatch):
+    monkeypatch.setattr(
+        logistics_agent, "settings",
+        logistics_agent.settings.model_copy(update={"TRACKING_CACHE_MAX": 2})
+    )
+    agent = LogisticsAgent("logistics_1", "物流")
+    overdue = datetime.now() - timedelta(days=1)
+    for number in ("A1", "A2", "A3"):
+        agent._cache_tracking("ups", TrackingInfo(
+            tracking_number=number,
+            carrier="ups",
+            status=ShipmentStatus.EXCEPTION,
+            estimated_delivery=overdue
+        ))
+
+    assert ("ups", "A1") not in agent.tracking_cache
+    assert ("ups", "A1") not in agent._exception_keys
+    assert ("ups", "A1") not in agent._eta_by_key
+    assert "A1" not in agent._by_number
+    assert len(agent._eta_index) == 2
+
+    agent.tracking_cache.expire(agent.tracking_cache.timer() + agent.tracking_cache.ttl)
+
+    assert not agent._exception_keys
+    assert not agent._eta_index
+    assert not agent._eta_by_key
+    assert not agent._by_number
+
+
+async def test_concurrent_fetches_of_same_tracking_number_are_coalesced():
+    agent = LogisticsAgent("logistics_1", "物流")
+    calls = []
+    release = asyncio.Event()
+
+    async def fake_track(tracking_number):
+        calls.append(tracking_number)
+        await release.wait()
+        return TrackingInfo(tracking_number=tracking_number, carrier="ups", status=ShipmentStatus.IN_TRANSIT)
+
+    agent.supported_carriers["ups"] = fake_track
+
+    waiters = [asyncio.create_task(agent._fetch_tracking("ups", "1Z999")) for _ in range(5)]
+    other = asyncio.create_task(agent._fetch_tracking("ups", "1Z000"))
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*waiters)
+    await other
+
+    assert calls.count("1Z999") == 1
+    assert calls.count("1Z000") == 1
+    assert all(result is results[0] for result in results)
+    assert agent._inflight == {}
+
+
+async def test_cancelled_waiter_does_not_cancel_shared_fetch():
+    agent = LogisticsAgent("logistics_1", "物流")
+    release = asyncio.Event()
+
+    async def fake_track(tracking_number):
+        await release.wait()
+        return TrackingInfo(tracking_number=tracking_number, carrier="ups", status=ShipmentStatus.DELIVERED)
+
+    agent.supported_carriers["ups"] = fake_track
+
+    cancelled = asyncio.create_task(agent._fetch_tracking("ups", "1Z999"))
+    survivor = asyncio.create_task(agent._fetch_tracking("ups", "1Z999"))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    release.set()
+
+    assert (await survivor).status == ShipmentStatus.DELIVERED
+    with pytest.raises(asyncio.CancelledError):
+        await cancelled
+
+
+async def test_batch_track_coalesces_with_inflight_lookups(monkeypatch):
+    monkeypatch.setattr(
+        logistics_agent, "settings",
+        logistics_agent.settings.model_copy(update={"AFTERSHIP_API_KEY": "key"})
+    )
+    agent = LogisticsAgent("logistics_1", "物流")
+    agent._http = object()
+    single_calls = []
+    bulk_calls = []
+    release = asyncio.Event()
+
+    def info(tracking_number):
+        return TrackingInfo(tracking_number=tracking_number, carrier="ups", status=ShipmentStatus.IN_TRANSIT)
+
+    async def fake_track(tracking_number):
+        single_calls.append(tracking_number)
+        await release.wait()
+        return info(tracking_number)
+
+    async def fake_bulk(tracking_numbers):
+        bulk_calls.append(list(tracking_numbers))
+        await release.wait()
+        return {number: info(number) for number in tracking_numbers}
+
+    agent.supported_carriers["aftership"] = fake_track
+    agent._track_aftership_bulk = fake_bulk
+
+    single = asyncio.create_task(agent._fetch_tracking("aftership", "N1"))
+    await asyncio.sleep(0)
+    batch = asyncio.create_task(agent._batch_track({
+        "tracking_requests": [{"tracking_number": "N1"}, {"tracking_number": "N2"}]
+    }))
+    await asyncio.sleep(0)
+    joined = asyncio.create_task(agent._fetch_tracking("aftership", "N2"))
+    await asyncio.sleep(0)
+    release.set()
+    result = await batch
+    await asyncio.gather(single, joined)
+
+    assert single_calls == ["N1"]
+    assert bulk_calls == [["N2"]]
+    assert result["successful_requests"] == 2
+    assert agent._inflight == {}
@@ -0,0 +1,81 @@
+"""
+物流API测试
+"""
+
+import base64
+import hashlib
+import hmac
+
+import orjson
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.v1 import logistics
+from app.core.config import settings
+
+WEBHOOK_SECRET = "test-webhook-secret"
+WEBHOOK_URL = "/webhook/aftership"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # 设置对象已冻结，替换为带密钥的副本
+    monkeypatch.setattr(
+        logistics,
+        "settings",
+        settings.model_copy(update={"AFTERSHIP_WEBHOOK_SECRET": WEBHOOK_SECRET})
+    )
+    app = FastAPI()
+    app.include_router(logistics.router)
+    return TestClient(app)
+
+
+def _sign(body: bytes, secret: str = WEBHOOK_SECRET) -> str:
+    digest = hmac.new(secret.encode(), body, hashlib.sha256).digest()
+    return base64.b64encode(digest).decode()
+
+
+def test_webhook_accepts_valid_signature(client):
+    body = orjson.dumps({"msg": {"tracking_number": "1Z999", "slug": "ups", "tag": "InTransit"}})
+
+    response = client.post(WEBHOOK_URL, content=body, headers={"aftership-hmac-sha256": _sign(body)})
+
+    assert response.status_code == 200
+    assert response.json()["success"] is True
+
+
+@pytest.mark.parametrize("headers", [
+    {},
+    {"aftership-hmac-sha256": "invalid"},
+    {"aftership-hmac-sha256": _sign(b"{}", "other-secret")},
+])
+def test_webhook_rejects_missing_or_wrong_signature(client, headers):
+    response = client.post(WEBHOOK_URL, content=b"{}", headers=headers)
+
+    assert response.status_code == 401
+
+
+def test_webhook_rejects_signature_of_different_body(client):
+    response = client.post(
+        WEBHOOK_URL,
+        content=b'{"msg": {}}',
+        headers={"aftership-hmac-sha256": _sign(b"{}")}
+    )
+
+    assert response.status_code == 401
+
+
+def test_webhook_rejects_requests_when_secret_is_not_configured(monkeypatch):
+    monkeypatch.setattr(
+        logistics,
+        "settings",
+        settings.model_copy(update={"AFTERSHIP_WEBHOOK_SECRET": None})
+    )
+    app = FastAPI()
+    app.include_router(logistics.router)
+    body = orjson.dumps({"msg": {"tracking_number": "1Z999", "slug": "ups", "tag": "Delivered"}})
+
+    response = TestClient(app).post(WEBHOOK_URL, content=body)
+
+    assert response.status_code == 503